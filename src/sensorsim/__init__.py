@@ -1,11 +1,16 @@
-from sensorsim import instruments, montages, tools
+from sensorsim import cache, instruments, live, montages, runfile, simulation, sweep, tools
 
 
 
 
 __all__ = [
+    'cache',
     'instruments',
+    'live',
     'montages',
+    'runfile',
+    'simulation',
+    'sweep',
     'tools'
 ]
 
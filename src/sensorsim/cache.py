@@ -0,0 +1,198 @@
+"""
+This module provides an on-disk cache of simulation results : a run is identified by the hash of the whole
+chain configuration (components parameters and state, time generator settings, enclosure profiles, seed)
+and its result columns are stored as a numpy .npz file, so an identical run is loaded instead of simulated again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import types
+from functools import cached_property
+from typing import Callable, Dict
+
+import numpy as np
+
+from sensorsim.instruments import NoiseStream
+
+#: attributes which are not part of a configuration : observers graph, memoized or derived values, figures
+_DERIVED = {"_observers", "_muted_notifiers", "_schedule", "_timelines", "block",
+            "_target_key", "_settled_L_def", "_noiseless_key", "_noiseless_R",
+            "_horner_coefficients", "_horner_rows", "fig"}
+
+
+def _describe_code(code, seen):
+    """description of a code object : bytecode, constants (nested functions included) and names used"""
+    consts = [_describe_code(c, seen) if isinstance(c, types.CodeType) else _describe(c, seen) for c in code.co_consts]
+    return ["code", hashlib.sha256(code.co_code).hexdigest(), consts, list(code.co_names)]
+
+
+def _describe_function(value, seen):
+    """description of a python function : name, code, default values and values of its closure"""
+    closure = []
+    for cell in value.__closure__ or ():
+        try:
+            closure.append(_describe(cell.cell_contents, seen))
+        except ValueError:  # empty cell
+            closure.append(["empty"])
+    return ["function", value.__module__, value.__qualname__, _describe_code(value.__code__, seen),
+            _describe(value.__defaults__, seen), _describe(value.__kwdefaults__, seen), closure]
+
+
+def _describe(value, seen):
+    """json-able description of value, objects are described by their attributes (shared objects once)"""
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float, np.number, np.bool_)):
+        return repr(value.item() if isinstance(value, np.generic) else value)
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return ["ndarray", [_describe(v, seen) for v in value.ravel()], value.shape]
+        data = np.ascontiguousarray(value)
+        return ["ndarray", str(data.dtype), data.shape, hashlib.sha256(data.view(np.uint8)).hexdigest()]
+    if isinstance(value, (list, tuple)):
+        return [type(value).__name__, [_describe(v, seen) for v in value]]
+    if isinstance(value, dict):
+        return ["dict", sorted((str(k), _describe(v, seen)) for k, v in value.items())]
+    if isinstance(value, np.random.SeedSequence):
+        return ["SeedSequence", repr(value.entropy), value.spawn_key, value.n_children_spawned]
+    if isinstance(value, np.random.Generator):
+        return ["Generator", _describe(value.bit_generator.state, seen)]
+    if isinstance(value, NoiseStream):
+        # future values : the ones already drawn and not consumed, then the generator ones
+        return ["NoiseStream", value.block_size, _describe(value.rng, seen), _describe(value.remaining(), seen)]
+    if isinstance(value, type):
+        return ["type", value.__module__, value.__qualname__]
+    if isinstance(value, (types.BuiltinFunctionType, np.ufunc)):
+        owner = getattr(value, "__self__", None)
+        owner = None if owner is None or isinstance(owner, types.ModuleType) else _describe(owner, seen)
+        return ["builtin", getattr(value, "__module__", None), getattr(value, "__qualname__", value.__name__), owner]
+    if id(value) in seen:
+        return ["ref", seen[id(value)]]
+    seen[id(value)] = len(seen)
+    if isinstance(value, types.FunctionType):
+        return _describe_function(value, seen)
+    if isinstance(value, types.MethodType):
+        return ["method", _describe(value.__func__, seen), _describe(value.__self__, seen)]
+    if not hasattr(value, "__dict__"):
+        raise TypeError(f"{type(value).__qualname__} object can not be described in a configuration hash")
+    cls = type(value)
+    attributes = {k: v for k, v in vars(value).items()
+                  if k not in _DERIVED and not isinstance(getattr(cls, k, None), cached_property)}
+    return [f"{cls.__module__}.{cls.__qualname__}", _describe(attributes, seen)]
+
+
+def config_hash(*objects, **extra) -> str:
+    """
+    hash of the configuration of objects (components of the chain, arrays, numbers...) and of the extra parameters.
+    Components are described by all their attributes, following references (ex : a Resistance brings its membrane,
+    its environment, the environment seed...), so it is a key of the state of the chain before a run.
+    """
+    description = json.dumps(_describe([list(objects), extra], {}), separators=(",", ":"))
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def recorder_columns(recorder) -> Dict[str, np.ndarray]:
+    """columns of a Recorder : "snap_time" and one column per recording (None values become NaN)"""
+    columns = {"snap_time": np.asarray(recorder.snap_time)}
+    for k, v in recorder.recordings.items():
+        try:
+            columns[k] = np.asarray(v, dtype=float)
+        except (TypeError, ValueError):
+            columns[k] = np.asarray(v)
+    return columns
+
+
+class ResultCache:
+    """
+    Content addressed cache of run results on local disk, one .npz file per run.
+    The least recently used entries are removed when the cache goes over max_entries files or max_bytes.
+
+    Params :
+        - directory : cache directory (created if needed)
+        - max_entries : maximum number of stored runs (None : no limit)
+        - max_bytes : maximum total size of the stored runs (None : no limit)
+
+    Example :
+        results = cache.ResultCache("~/.cache/sensorsim", max_bytes=2e9)
+        key = results.key(tg, TE, wheastone, gen, ampli, gen_ao)
+        out = results.cached(key, lambda: simulation.simulate_analog(tg, TE, wheastone, gen, ampli, gen_ao))
+    """
+    suffix = ".npz"
+
+    def __init__(self, directory, max_entries=None, max_bytes=None) -> None:
+        self.directory = os.path.expanduser(directory)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(*objects, **extra) -> str:
+        """key of a run (see config_hash), to be computed before the run (it changes the components state)"""
+        return config_hash(*objects, **extra)
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def __contains__(self, key) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        """stored columns of key (dict of arrays), or None"""
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                columns = {k: data[k] for k in data.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        os.utime(path)
+        return columns
+
+    def put(self, key, columns):
+        """store columns (dict of arrays, or a Recorder) for key and evict old entries if needed"""
+        if hasattr(columns, "recordings"):
+            columns = recorder_columns(columns)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **{k: np.asarray(v) for k, v in columns.items()})
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def cached(self, key, run:Callable):
+        """stored columns of key, or run() result (dict of arrays or Recorder) once stored"""
+        columns = self.get(key)
+        if columns is None:
+            columns = run()
+            if hasattr(columns, "recordings"):
+                columns = recorder_columns(columns)
+            columns = {k: np.asarray(v) for k, v in columns.items()}
+            self.put(key, columns)
+        return columns
+
+    def entries(self):
+        """(path, size, last use) of the stored runs, least recently used first"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix) and entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return sorted(entries, key=lambda e: e[2])
+
+    def evict(self):
+        """remove least recently used entries until the limits are respected"""
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries)
+                           or (self.max_bytes is not None and total > self.max_bytes)):
+            path, size, _ = entries.pop(0)
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
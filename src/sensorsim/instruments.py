@@ -3,17 +3,22 @@ This module provides all the instruments
 """
 
 from abc import ABC, abstractmethod
-from random import random
-from math import pi, asin
-from typing import Dict, List
+from functools import cached_property, partial
+from math import gcd, pi, asin
+from operator import attrgetter
+from typing import Dict, List, NamedTuple
 import warnings
 from numpy import ndarray
 import numpy as np
+import pandas as pd
 
 
-from sensorsim.tools import compute_error
+from sensorsim.runfile import RunFile, RunWriter
+from sensorsim.tools import compute_error, decimate, lag_filter
 
 class Notifier:
+    _muted = False
+
     def __init__(self) -> None:
         self._observers= []
 
@@ -21,11 +26,24 @@ class Notifier:
         self._observers.append(callback)
 
     def notify(self) -> None:
+        if self._muted:
+            return
         for observer in self._observers:
             observer.update(self)
 
+    def notify_block(self) -> None:
+        """notify observers that a block of ticks is available (see TimeGenerator.iter_blocks)"""
+        for observer in self._observers:
+            update_block = getattr(observer, "update_block", None)
+            if update_block is None:
+                raise TypeError(f"{type(observer).__name__} does not support block iteration")
+            update_block(self)
+
 
 class Observer(ABC):
+    #: True if the observer writes into the notifier it observes (ex: TestEnclosure sets Environment P and T),
+    #: a compiled schedule then updates it before the other observers of this notifier
+    drives_notifier = False
 
     @abstractmethod
     def update(self, notifier:Notifier) -> None:
@@ -35,36 +53,157 @@ class Observer(ABC):
         pass
     
 
+class NoiseStream:
+    """
+    Uniform noise source in [-1, 1) with its own numpy.random.Generator.
+    Values are drawn by blocks and consumed from a buffer : a call costs an index in a list.
+    The sequence only depends on the seed, whatever the mix of calls and draw.
+
+    Params :
+        - seed : seed or numpy.random.SeedSequence (default : fresh entropy)
+        - block_size : number of values drawn at once
+
+    Example :
+        stream = NoiseStream(42)
+        v = 5 * (1 + 1e-3*stream())
+        v_block = 5 * (1 + 1e-3*stream.draw(1000))
+    """
+    def __init__(self, seed=None, block_size=4096):
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._buffer = []
+        self._position = 0
+
+    def _new_blocks(self, number):
+        return 2*self.rng.random(number*self.block_size) - 1
+
+    def __call__(self):
+        try:
+            value = self._buffer[self._position]
+        except IndexError:
+            self._buffer = self._new_blocks(1).tolist()
+            self._position = 0
+            value = self._buffer[0]
+        self._position += 1
+        return value
+
+    def draw(self, n):
+        """next n values of the stream as an array"""
+        head = np.array(self._buffer[self._position:self._position + n], dtype=float)
+        self._position += head.size
+        missing = n - head.size
+        if missing <= 0:
+            return head
+        values = self._new_blocks(-(-missing // self.block_size))
+        self._buffer = values[missing:].tolist()
+        self._position = 0
+        return np.concatenate((head, values[:missing]))
+
+    def remaining(self):
+        """values drawn from the generator and not consumed yet (with rng state, they give the whole future sequence)"""
+        return np.array(self._buffer[self._position:], dtype=float)
+
+
+class TimeBlock(NamedTuple):
+    """
+    Block of consecutive real ticks produced by TimeGenerator.blocks
+
+    Params :
+        - index : real tick indices
+        - time : tick times (ms)
+        - is_exp : True where the tick is an experiment step
+        - exp_index : index of the last experiment step reached at each tick
+    """
+    index: ndarray
+    time: ndarray
+    is_exp: ndarray
+    exp_index: ndarray
+
+
 class TimeGenerator(Notifier): 
-    def __init__(self, duree_second, experiment_step_ms = 1000, real_time_step_ms = 10) -> None:
+    """
+    Object generating the time base of the experiment.
+    Time is handled as integer ticks in ms : the tick i of the real timeline is at i*real_time_step_ms
+    and the experiment steps are at k*experiment_step_ms. The timelines sizes are computed once and
+    cached, and the experiment step of a tick is derived by integer division, so each tick costs O(1).
+
+    Params :
+        - duree_second : duration of the experiment (s)
+        - experiment_step_ms : time between two changes of the experiment conditions (ms)
+        - real_time_step_ms : time between two simulation ticks (ms)
+        - streaming : if True, t_real and t_experiment are never kept in memory (built on demand only).
+          Iteration never needs them, so long runs (days at 1 ms) keep a constant memory footprint.
+
+    Example :
+        tg = TimeGenerator(60, 1000, 10)
+        for tt in tg:
+            ...
+    """
+    def __init__(self, duree_second, experiment_step_ms = 1000, real_time_step_ms = 10, streaming=False) -> None:
         super().__init__()
+        self.streaming = streaming
+        self._timelines = {}
         self.current_time_index=0
-        self.tmax_second = duree_second
-        self.real_time_step_ms = real_time_step_ms
+        self._tmax_second = duree_second
+        self._real_time_step_ms = real_time_step_ms
         self._expe_step_ms = experiment_step_ms
         self.is_exp_time = True
         self.current_time = 0
         self.current_time_exp_index = 0
-        
+        self.ticks_elapsed = 1
+        self._schedule = None
+
+    def _reset_timebase(self):
+        """drop cached timelines when a time parameter changes"""
+        self._timelines = {}
+        for k in ("size_real", "size_exp", "len_real"):
+            self.__dict__.pop(k, None)
+
     @property
-    def t_real(self):
-        return np.linspace(0,1000*self.tmax_second,int(1000/self.real_time_step_ms)*self.tmax_second+1) 
+    def tmax_second(self):
+        return self._tmax_second
+
+    @tmax_second.setter
+    def tmax_second(self, value):
+        self._tmax_second = value
+        self._reset_timebase()
+
+    @property
+    def real_time_step_ms(self):
+        return self._real_time_step_ms
+
+    @real_time_step_ms.setter
+    def real_time_step_ms(self, value):
+        self._real_time_step_ms = value
+        self._reset_timebase()
+
+    def _timeline(self, name, size, step):
+        if name in self._timelines:
+            return self._timelines[name]
+        timeline = np.arange(size) * step
+        if not self.streaming:
+            self._timelines[name] = timeline
+        return timeline
 
     @property
+    def t_real(self):
+        return self._timeline("t_real", self.size_real, self.real_time_step_ms)
+
+    @cached_property
     def size_real(self):
-        return self.t_real.size
+        return int(int(1000/self.real_time_step_ms)*self.tmax_second) + 1
     
-    @property
+    @cached_property
     def size_exp(self):
-        return self.t_experiment.size
+        return int(1000/(self._expe_step_ms)*self.tmax_second) + 1
 
-    @property
+    @cached_property
     def len_real(self):
-        return len(self.t_real)
+        return self.size_real
 
     @property
     def t_experiment(self):
-        return np.linspace(0,self.tmax_second*1000,int(1000/(self._expe_step_ms)*self.tmax_second)+1) 
+        return self._timeline("t_experiment", self.size_exp, self._expe_step_ms)
 
     @property
     def experiment_step_ms(self):
@@ -73,18 +212,173 @@ class TimeGenerator(Notifier):
     @experiment_step_ms.setter
     def experiment_step_ms(self, value):
         self._expe_step_ms = value
+        self._reset_timebase()
+
+    def _set_tick(self, index):
+        """set current time state at the real tick index"""
+        time_real = int(index * self._real_time_step_ms)
+        exp_index, remainder = divmod(time_real, self._expe_step_ms)
+        self.current_time_index = index + 1
+        self.is_exp_time = remainder == 0 and exp_index < self.size_exp
+        if self.is_exp_time:
+            self.current_time_exp_index = int(exp_index)
+        self.current_time = time_real
+
+    def next_exp_tick(self, index):
+        """
+        return the index of the first real tick after index which is an experiment step, or None
+        """
+        step = self._real_time_step_ms
+        k = int(index * step) // self._expe_step_ms + 1
+        while k < self.size_exp:
+            tick = int(-(-k * self._expe_step_ms // step))
+            if tick >= self.size_real:
+                return None
+            if int(tick * step) == k * self._expe_step_ms:
+                return tick
+            k += 1
+        return None
+
+    def components(self):
+        """
+        return all the objects notified (directly or not) by the time generator, in breadth-first order
+        """
+        found = []
+        queue = [self]
+        while queue:
+            notifier = queue.pop(0)
+            for observer in getattr(notifier, "_observers", []):
+                if not any(observer is f for f in found):
+                    found.append(observer)
+                    queue.append(observer)
+        return found
+
+    def compile(self):
+        """
+        Compile the observers graph into a flat schedule : at each tick every component is updated exactly once,
+        after the components it observes, instead of the nested notify cascade.
+        Call it once the whole chain is built (observers bound later are not in the schedule).
+        Return the components in update order.
+        """
+        components = self.components()
+        source = {}
+        after = {id(c): [] for c in components}
+        for notifier in [self] + components:
+            observers = getattr(notifier, "_observers", [])
+            drivers = [o for o in observers if o.drives_notifier]
+            for observer in observers:
+                source.setdefault(id(observer), notifier)
+                if notifier is not self:
+                    after[id(observer)].append(notifier)
+                if not observer.drives_notifier:
+                    after[id(observer)].extend(drivers)
+
+        order = []
+        done = set()
+        pending = list(components)
+        while pending:
+            for component in pending:
+                if all(id(c) in done for c in after[id(component)]):
+                    break
+            else:
+                raise ValueError("observers graph has a cycle, it can not be compiled")
+            pending.remove(component)
+            done.add(id(component))
+            order.append(component)
+
+        self._muted_notifiers = [c for c in order if isinstance(c, Notifier)]
+        self._schedule = [(c, source[id(c)]) for c in order]
+        return order
+
+    def reset_schedule(self):
+        """go back to the notify cascade"""
+        self._schedule = None
+
+    def notify(self) -> None:
+        if self._schedule is None:
+            return super().notify()
+        for notifier in self._muted_notifiers:
+            notifier._muted = True
+        try:
+            for component, notifier in self._schedule:
+                component.update(notifier)
+        finally:
+            for notifier in self._muted_notifiers:
+                notifier._muted = False
 
     def __iter__(self):
         self.current_time_index = 0
-        for i in self.t_real:
-            time_real = int(self.t_real[self.current_time_index])
-            self.current_time_index += 1
-            self.is_exp_time = time_real in self.t_experiment
-            if self.is_exp_time:
-                self.current_time_exp_index = int(np.where(time_real == self.t_experiment)[0])
-            self.current_time = time_real
+        self.ticks_elapsed = 1
+        for i in range(self.size_real):
+            self._set_tick(i)
+            self.notify()
+            yield self.current_time
+
+    def iter_events(self):
+        """
+        Event-driven iteration mode : only the ticks where a component state can change are generated.
+        Each component can implement next_event(tg) returning the next tick index where its own state changes
+        (None if it has no own events) : TestEnclosure (experiment steps), Horloge (clock pulses),
+        Membrane (while settling). Components without next_event are evaluated at every tick.
+        The first and the last tick are always generated, and tg.ticks_elapsed gives the number of real ticks
+        since the previous generated one. Between two events, values are held (see Recorder.hold).
+
+        Example :
+            for tt in tg.iter_events():
+                can(EB(V_gain))
+        """
+        components = self.components()
+        last = self.size_real - 1
+        previous = 0
+        i = 0
+        while i <= last:
+            self.ticks_elapsed = max(i - previous, 1)
+            previous = i
+            self._set_tick(i)
             self.notify()
-            yield time_real
+            yield self.current_time
+            following = last if i < last else last + 1
+            for component in components:
+                next_event = getattr(component, "next_event", None)
+                tick = i + 1 if next_event is None else next_event(self)
+                if tick is not None and i < tick < following:
+                    following = tick
+            i = following
+        self.ticks_elapsed = 1
+
+    def blocks(self, chunk_size=4096):
+        """
+        Generate the timeline as TimeBlock of chunk_size consecutive ticks, without notifying observers.
+        """
+        last_exp_index = -1
+        for start in range(0, self.size_real, chunk_size):
+            index = np.arange(start, min(start + chunk_size, self.size_real))
+            time = (index * self._real_time_step_ms).astype(np.int64)
+            exp_index, remainder = np.divmod(time, self._expe_step_ms)
+            is_exp = (remainder == 0) & (exp_index < self.size_exp)
+            exp_index = np.maximum.accumulate(np.where(is_exp, exp_index, last_exp_index)).astype(np.int64)
+            last_exp_index = exp_index[-1]
+            yield TimeBlock(index, time, is_exp, exp_index)
+
+    def iter_blocks(self, chunk_size=4096):
+        """
+        Block iteration mode : yields TimeBlock of chunk_size ticks and notifies observers once per block.
+        All the observers of the chain have to implement update_block (Environment, TestEnclosure, Membrane, Resistance).
+        Inside the loop, the components hold arrays of values for the whole block.
+
+        Example :
+            for block in tg.iter_blocks(10000):
+                R = R3()  # array of len(block.time)
+        """
+        for block in self.blocks(chunk_size):
+            self.block = block
+            self.current_time_index = int(block.index[-1]) + 1
+            self.current_time = int(block.time[-1])
+            self.is_exp_time = bool(block.is_exp[-1])
+            if block.exp_index[-1] >= 0:
+                self.current_time_exp_index = int(block.exp_index[-1])
+            self.notify_block()
+            yield block
         
 class Environment(Notifier, Observer):
     """
@@ -95,17 +389,34 @@ class Environment(Notifier, Observer):
     - T : temperature
     - time : current time
     - P : pressure
+    - seed : seed of the simulation : every noise source created with this environment draws from its own
+      stream spawned from numpy.random.SeedSequence(seed), so a run is reproducible from this single seed
     """
-    def __init__(self, tg:TimeGenerator, T=20, time=0, P=1e6):
+    def __init__(self, tg:TimeGenerator, T=20, time=0, P=1e6, seed=None):
         super().__init__()
         tg.bind_to(self)
+        self.tg = tg
         self.T = T
         self._time = time
         self.P = P
+        self.ticks_elapsed = 1
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+    def noise_stream(self):
+        """new independent NoiseStream spawned from the simulation seed"""
+        return NoiseStream(self.seed_sequence.spawn(1)[0])
 
     def update(self, notifier):
+        self.ticks_elapsed = notifier.ticks_elapsed
         self.time = notifier.current_time
 
+    def next_event(self, tg):
+        return None
+
+    def update_block(self, notifier):
+        self._time = notifier.block.time
+        self.notify_block()
+
     @property
     def time(self):
         return self._time
@@ -120,6 +431,8 @@ class Environment(Notifier, Observer):
         self._observers.append(callback)
 
 class TestEnclosure(Observer):
+    drives_notifier = True
+
     def __init__(self, E:Environment, P:np.ndarray, T:np.ndarray, t: TimeGenerator) -> None:
         self.P = P
         self.T = T
@@ -129,45 +442,298 @@ class TestEnclosure(Observer):
         self._check_len()
 
     def _check_len(self):
-        if not (len(self.P) == len(self.T) == len(self.t.t_experiment)):
+        if not (len(self.P) == len(self.T) == self.t.size_exp):
             raise ValueError("Length of time is not the same than P and T")
         
     def update(self, notifier):
         if self.t.is_exp_time:
             self.E.P, self.E.T =self.get_env(self.t.current_time_exp_index)
 
+    def next_event(self, tg):
+        return tg.next_exp_tick(tg.current_time_index - 1)
+
+    def update_block(self, notifier):
+        exp_index = self.t.block.exp_index
+        started = exp_index >= 0
+        P, T = self.get_env(np.where(started, exp_index, 0))
+        self.E.P = np.where(started, P, np.ravel(self.E.P)[-1])
+        self.E.T = np.where(started, T, np.ravel(self.E.T)[-1])
+
     def get_env(self,index):
         return (self.P[index], self.T[index])
 
+class ColumnarStorage:
+    """
+    Recorder storage in preallocated numpy columns (float64, missing values are NaN).
+    Snapshots are gathered by chunks of rows and written column-wise, the capacity is doubled when it is full.
+
+    Params :
+        - capacity : initial number of rows (ex : TimeGenerator.size_real)
+        - chunk_size : number of snapshots gathered before being written in the columns
+    """
+    def __init__(self, capacity=1024, chunk_size=4096) -> None:
+        self.keys = []
+        self.capacity = max(int(capacity), 1)
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.time = np.empty(self.capacity)
+        self.data = np.empty((0, self.capacity))
+        self._rows = []
+        self.writers = []
+
+    def add_key(self, key):
+        if key in self.keys:
+            return
+        self.flush()
+        self.keys.append(key)
+        column = np.full((1, self.capacity), np.nan)
+        self.data = np.concatenate((self.data, column))
+
+    def _reserve(self, size):
+        if size <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        self.time = np.concatenate((self.time, np.empty(capacity - self.capacity)))
+        self.data = np.concatenate((self.data, np.empty((len(self.keys), capacity - self.capacity))), axis=1)
+        self.capacity = capacity
+
+    @staticmethod
+    def _to_float(value, key):
+        try:
+            return np.nan if value is None else float(value)
+        except (TypeError, ValueError):
+            warnings.warn(f"Something went wrong during snapping for varaible {key}")
+            return np.nan
+
+    def append(self, time, values):
+        """add a snapshot : values in the order of keys"""
+        self._rows.append((time, *values))
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def _take_rows(self):
+        """gathered snapshots as a float array (time in the first column)"""
+        try:
+            rows = np.array(self._rows, dtype=float)
+        except (TypeError, ValueError):
+            keys = ["time"] + self.keys
+            rows = np.array([[self._to_float(v, k) for v, k in zip(row, keys)] for row in self._rows])
+        self._rows = []
+        for writer in self.writers:
+            writer.write(rows[:, 0], dict(zip(self.keys, rows[:, 1:].T)))
+        return rows
+
+    def flush(self):
+        """write the gathered snapshots in the columns"""
+        if not self._rows:
+            return
+        rows = self._take_rows()
+        start, stop = self.size, self.size + rows.shape[0]
+        self._reserve(stop)
+        self.time[start:stop] = rows[:, 0]
+        self.data[:, start:stop] = rows[:, 1:].T
+        self.size = stop
+
+    def columns(self):
+        """{key: view on the recorded values}"""
+        self.flush()
+        return {k: self.data[i, :self.size] for i, k in enumerate(self.keys)}
+
+    def times(self):
+        self.flush()
+        return self.time[:self.size]
+
+    def rows_since(self, start):
+        """
+        (stop, time, data) of the written rows start..stop, without writing the gathered snapshots,
+        so it can be called from another thread while recording (see live.LiveMonitor)
+        """
+        stop = self.size
+        return stop, self.time[start:stop], self.data[:, start:stop]
+
+
+def column_statistics(values):
+    """
+    statistics of the columns of values (rows x columns array, NaN are ignored) :
+    dict of arrays "count", "min", "max", "mean", "m2" (sum of the squared deviations from the mean)
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0).sum(axis=0) / count
+        m2 = np.where(valid, (values - mean)**2, 0).sum(axis=0)
+    return {"count": count, "min": np.where(valid, values, np.inf).min(axis=0, initial=np.inf),
+            "max": np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf), "mean": mean, "m2": m2}
+
+
+def merge_statistics(a, b):
+    """statistics of the union of two sets of rows (Welford / Chan update of the mean and m2)"""
+    count = a["count"] + b["count"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.where(b["count"] > 0, b["mean"], 0) - np.where(a["count"] > 0, a["mean"], 0)
+        weight = np.where(count > 0, b["count"] / count, 0)
+        mean = np.where(a["count"] > 0, a["mean"], 0) + delta*weight
+        m2 = np.where(a["count"] > 0, a["m2"], 0) + np.where(b["count"] > 0, b["m2"], 0) + delta**2 * a["count"]*weight
+    return {"count": count, "min": np.minimum(a["min"], b["min"]), "max": np.maximum(a["max"], b["max"]),
+            "mean": np.where(count > 0, mean, np.nan), "m2": m2}
+
+
+class RingStorage(ColumnarStorage):
+    """
+    Recorder storage with a fixed capacity : the oldest snapshots are overwritten, so memory does not depend
+    on the duration of the run. Running statistics of each recording are kept since the start (see column_statistics).
+
+    Params :
+        - capacity : number of snapshots kept (the most recent ones)
+        - chunk_size : number of snapshots gathered before being written in the columns
+    """
+    def __init__(self, capacity, chunk_size=4096) -> None:
+        super().__init__(capacity, min(chunk_size, capacity))
+        self.total = 0
+        self.stats = column_statistics(np.empty((0, 0)))
+
+    def add_key(self, key):
+        if key in self.keys:
+            return
+        super().add_key(key)
+        new = column_statistics(np.empty((0, 1)))
+        self.stats = {k: np.concatenate((v, new[k])) for k, v in self.stats.items()}
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = self._take_rows()
+        self.stats = merge_statistics(self.stats, column_statistics(rows[:, 1:]))
+        kept = rows[-self.capacity:]
+        position = (self.total + rows.shape[0] - kept.shape[0] + np.arange(kept.shape[0])) % self.capacity
+        self.time[position] = kept[:, 0]
+        self.data[:, position] = kept[:, 1:].T
+        self.total += rows.shape[0]
+        self.size = min(self.total, self.capacity)
+
+    def _order(self):
+        start = self.total % self.capacity if self.total > self.capacity else 0
+        return slice(0, self.size) if start == 0 else np.roll(np.arange(self.capacity), -start)
+
+    def columns(self):
+        """{key: recorded values of the current window} (views until the buffer wraps around, copies after)"""
+        self.flush()
+        order = self._order()
+        return {k: self.data[i, order] for i, k in enumerate(self.keys)}
+
+    def times(self):
+        self.flush()
+        return self.time[self._order()]
+
+    def statistics(self):
+        self.flush()
+        return self.stats
+
+    def rows_since(self, start):
+        """as ColumnarStorage.rows_since, start is counted since the beginning (overwritten rows are skipped)"""
+        stop = self.total
+        start = max(start, stop - self.capacity)
+        position = np.arange(start, stop) % self.capacity
+        return stop, self.time[position], self.data[:, position]
+
+
 class Recorder:
-    def __init__(self, E:Environment, title_recorder:str="Recorder graphs") -> None:
-        self.recordings = {}
+    """
+    Record values of the simulation at each snapshot.
+
+    Params :
+        - E : environment (its time is the snapshot time)
+        - title_recorder : title of the graphs
+        - storage : "list" (default) : recordings are python lists, any value can be recorded ;
+          "columnar" : recordings are float numpy columns preallocated for the whole run (missing values are NaN),
+          recordings and snap_time give array views. Use it for long runs of numeric values.
+          "ring" : columns of a fixed capacity keeping the most recent snapshots only (soak tests running for days),
+          statistics since the start are given by statistics().
+        - capacity : initial size of the columns, doubled when they are full (default : number of ticks of the
+          time generator, 1024 if it is streaming), number of snapshots kept for the "ring" storage (required)
+    """
+    #: number of snapshots read at once by statistics()
+    statistics_chunk = 65536
+
+    def __init__(self, E:Environment, title_recorder:str="Recorder graphs", storage="list", capacity=None) -> None:
+        if storage not in ("list", "columnar", "ring"):
+            raise ValueError(f"unknown storage {storage}, expected 'list', 'columnar' or 'ring'")
+        if storage == "ring" and capacity is None:
+            raise ValueError("the ring storage needs a capacity")
+        self.storage = storage
+        self.capacity = capacity
         self.name_recordings = {}
         self.type_plot = {}
-        self.snap_time = []
         self.title_graph=title_recorder
         self.E = E
-        # self.config_record(dict_config)
-        # a=1
+        self.reset()
+
+    def _new_store(self):
+        capacity = self.capacity
+        if capacity is None:
+            tg = getattr(self.E, "tg", None)
+            # a streamed run is not allocated for its whole duration : the columns double when they are full
+            capacity = 1024 if tg is None or tg.streaming else tg.size_real
+        if self.storage == "ring":
+            return RingStorage(capacity)
+        return ColumnarStorage(capacity)
 
     def reset(self):
         """reset all records"""
+        self._store = None
+        self._probes = {}
+        self._sampler = None
         self.recordings = {}
         self.name_recordings = {}
-        self.snap_time = {}
+        self.snap_time = []
+
+    @property
+    def recordings(self):
+        if self._store is not None:
+            return self._store.columns()
+        return self._recordings
+
+    @recordings.setter
+    def recordings(self, value):
+        self._sampler = None
+        if self.storage != "list":
+            self._store = self._new_store()
+            for k in value:
+                self._store.add_key(k)
+        self._recordings = value
+
+    @property
+    def snap_time(self):
+        if self._store is not None:
+            return self._store.times()
+        return self._snap_time
+
+    @snap_time.setter
+    def snap_time(self, value):
+        self._snap_time = value
+
+    def _add_recording(self, k):
+        self._sampler = None
+        if self._store is not None:
+            self._store.add_key(k)
+        elif k not in self._recordings:
+            self._recordings[k] = []
 
     def config(self, config_record:Dict[str,List]):
         """pass here a dict with {variable id (str) (real name of variable) : [name you want in graph (str), bool of type graph (see config_plot)]}"""
         for k,v in config_record.items():
             self.name_recordings[k] = v[0]
             self.type_plot[k] = v[1]
-            self.recordings[k] = []
+            self._add_recording(k)
 
     def config_name(self, config_record:Dict):
         """pass here a dict with {variable id (str) (real name of variable) : name you want in graph (str)}"""
         for k,v in config_record.items():
             self.name_recordings[k] = v
-            self.recordings[k] = []
+            self._add_recording(k)
 
     def config_plot(self,config_graph_type:Dict[str,bool]):
         """pass here a dict with {variable id (str) (real name of variable) : True/False} with True for numeric value and False for analogic """
@@ -182,7 +748,60 @@ class Recorder:
         """pass here a dict of {variable id (str) (real name of variable) : value to save}"""
         self._base_snap(d)
 
+    def probe(self, key, source, attr=None, name=None, type_plot=None):
+        """
+        bind the recording key to a value read at each call of sample :
+        the attribute attr of source (ex : r.probe("M", membrane, "L_def")) or, if attr is None, the result of source().
+        name is the name in graph (default : key) and type_plot the type of graph (see config_plot).
+
+        Example :
+            r.probe("M", membrane, "L_def", "Membrane")
+            r.probe("cout", can, "out", "can output", type_plot=True)
+            r.probe("V_gain", lambda: V_gain)
+            for tt in tg:
+                ...
+                r.sample()
+        """
+        if attr is not None and not all(part.isidentifier() for part in attr.split(".")):
+            raise ValueError(f"invalid attribute name {attr}")
+        self._probes[key] = (source, attr)
+        self.name_recordings[key] = key if name is None else name
+        if type_plot is not None:
+            self.type_plot[key] = type_plot
+        self._add_recording(key)
+
+    def _compile_sampler(self):
+        # one getter per recording, built once in the order of the recordings (attrgetter bound to its source),
+        # so a sample costs one call per probe, without any dict lookup
+        keys = self._store.keys if self._store is not None else list(self._recordings)
+        getters = []
+        for k in keys:
+            if k not in self._probes:
+                getters.append(lambda: None)
+                continue
+            source, attr = self._probes[k]
+            getters.append(source if attr is None else partial(attrgetter(attr), source))
+        getters = tuple(getters)
+        read = lambda: tuple(g() for g in getters)
+        appends = [] if self._store is not None else [self._recordings[k].append for k in keys]
+        self._sampler = (read, appends)
+
+    def sample(self):
+        """snapshot of the probes values (recordings without probe get None), to call once per tick"""
+        if self._sampler is None:
+            self._compile_sampler()
+        read, appends = self._sampler
+        if self._store is not None:
+            self._store.append(self.E.time, read())
+            return
+        self._snap_time.append(self.E.time)
+        for append, value in zip(appends, read()):
+            append(value)
+
     def _base_snap(self, d):
+        if self._store is not None:
+            self._store.append(self.E.time, [d.get(r, None) for r in self._store.keys])
+            return
         self.snap_time.append(self.E.time)
         for r in self.recordings.keys():
             try:
@@ -191,12 +810,153 @@ class Recorder:
                 warnings.warn(f"Something went wrong during snapping for varaible {r}")
     
 
-    def plot(self, graph_record_map:Dict):
+    def stream_to(self, path):
+        """
+        write the recordings in the run directory path during the run (see runfile), chunk by chunk,
+        with the columnar or ring storage. The snapshots already in the columns are written first.
+        Call close_stream at the end of the run. The run is reopened with Recorder.open(path).
+
+        Example :
+            r = Recorder(E, storage="ring", capacity=100_000)
+            r.config_name({...})
+            r.stream_to("run_1")
+            for tt in tg:
+                ...
+            r.close_stream()
+        """
+        if not isinstance(self._store, ColumnarStorage):
+            raise ValueError("stream_to needs the 'columnar' or 'ring' storage")
+        tg = getattr(self.E, "tg", None)
+        timebase = None if tg is None else {"tmax_second": tg.tmax_second, "experiment_step_ms": tg.experiment_step_ms,
+                                            "real_time_step_ms": tg.real_time_step_ms}
+        writer = RunWriter(path, self._store.keys, self.name_recordings, self.type_plot, timebase, self.title_graph)
+        writer.write(self._store.times(), self._store.columns())
+        self._store.writers.append(writer)
+        return writer
+
+    def close_stream(self):
+        """write the last snapshots and close the run directories of stream_to"""
+        self._store.flush()
+        for writer in self._store.writers:
+            writer.close()
+        self._store.writers = []
+
+    @classmethod
+    def open(cls, path, E:Environment=None):
+        """
+        Recorder of a run directory (see stream_to and runfile) : recordings and snap_time are numpy.memmap
+        columns read from the disk on access, so plot, hold, statistics work without loading the run in memory.
+        """
+        run = RunFile(path)
+        recorder = cls(E, run.header["title"])
+        recorder.storage = "file"
+        recorder._store = run
+        recorder.name_recordings = dict(run.name_recordings)
+        recorder.type_plot = dict(run.type_plot)
+        return recorder
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        recordings as a DataFrame indexed by snap_time, with the names of name_recordings as columns.
+        It is a snapshot of the rows recorded so far : snapshots taken later are not in it.
+        Only with the columnar storage it is zero-copy : a view on the columns, valid until the next reset
+        or growth of the columns (then it may show a stale buffer, call to_dataframe again). With the other storages
+        (list, ring, opened run) values are copied. Missing values (None) are NaN.
+        """
+        index = pd.Index(self.snap_time, name="snap_time", copy=False)
+        if isinstance(self._store, ColumnarStorage) and not isinstance(self._store, RingStorage):
+            keys = self._store.keys
+            columns = [self.name_recordings.get(k, k) for k in keys]
+            # data is (channels x rows) : its transpose is the (rows x channels) block pandas keeps as is
+            return pd.DataFrame(self._store.data[:, :self._store.size].T, index=index, columns=columns, copy=False)
+        columns = {}
+        for k, v in self.recordings.items():
+            try:
+                columns[self.name_recordings.get(k, k)] = np.asarray(v, dtype=float)
+            except (TypeError, ValueError):
+                columns[self.name_recordings.get(k, k)] = pd.Series(list(v), index=index, dtype=object)
+        return pd.DataFrame(columns, index=index)
+
+    def read_since(self, start):
+        """
+        (stop, time, {key: values}) of the snapshots start..stop recorded until now, as float arrays.
+        It can be called from another thread during the run (the columnar storages give the snapshots
+        already written in the columns, see ColumnarStorage.chunk_size).
+        """
+        if self._store is not None:
+            stop, time, data = self._store.rows_since(start)
+            return stop, time, dict(zip(self._store.keys, data))
+        recordings = dict(self._recordings)
+        stop = min([len(self._snap_time)] + [len(v) for v in recordings.values()])
+        values = {}
+        for k, v in recordings.items():
+            try:
+                values[k] = np.asarray(v[start:stop], dtype=float)
+            except (TypeError, ValueError):
+                pass
+        return stop, np.asarray(self._snap_time[start:stop]), values
+
+    def statistics(self):
+        """
+        statistics of each numeric recording since the start of the run (with the "ring" storage, also of the
+        overwritten snapshots) : {key: {"count", "min", "max", "mean", "var"}}, missing values are ignored.
+        Recordings of other values (ex : arrays or strings with the list storage) are not in the result.
+        """
+        if isinstance(self._store, RingStorage):
+            stats = self._store.statistics()
+            keys = self._store.keys
+        else:
+            keys, columns = [], []
+            for k, values in self.recordings.items():
+                column = self._recording_statistics(values)
+                if column is not None:
+                    keys.append(k)
+                    columns.append(column)
+            stats = column_statistics(np.empty((0, 0)))
+            if columns:
+                stats = {s: np.concatenate([c[s] for c in columns]) for s in stats}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = stats["m2"] / stats["count"]
+        empty = stats["count"] == 0
+        minimum = np.where(empty, np.nan, stats["min"])
+        maximum = np.where(empty, np.nan, stats["max"])
+        return {k: {"count": int(stats["count"][i]), "min": minimum[i], "max": maximum[i],
+                    "mean": stats["mean"][i], "var": var[i]} for i, k in enumerate(keys)}
+
+    def _recording_statistics(self, values):
+        """column_statistics of one recording read by chunks (a run opened from the disk is never loaded as a whole), None if it is not numeric"""
+        stats = column_statistics(np.empty((0, 1)))
+        for start in range(0, len(values), self.statistics_chunk):
+            chunk = values[start:start + self.statistics_chunk]
+            if isinstance(chunk, list):
+                chunk = [np.nan if v is None else v for v in chunk]
+            try:
+                chunk = np.asarray(chunk, dtype=float)
+            except (TypeError, ValueError):
+                return None
+            if chunk.ndim != 1:
+                return None
+            stats = merge_statistics(stats, column_statistics(chunk[:, None]))
+        return stats
+
+    def hold(self, time):
+        """
+        return recordings resampled on time (ms) with hold semantics : each value is kept until the next snapshot.
+        Useful after an event-driven run (TimeGenerator.iter_events) to get the same series than a tick by tick run.
+        Ex: values = r.hold(tg.t_real)
+        """
+        index = np.searchsorted(np.asarray(self.snap_time), time, side="right") - 1
+        index = np.maximum(index, 0)
+        return {k: np.asarray(v)[index] for k, v in self.recordings.items()}
+
+    def plot(self, graph_record_map:Dict, points_per_pixel=2, decimation="minmax"):
         """
         provide a dictionnary to define plot
         Ex:  graph_record_map={1:'P', 2:['R1','R2']} will display two graphs
         - the first with the variables recorded as 'P' id
         - the second with both 'R1' and 'R2' recorded values
+        Long recordings are decimated to points_per_pixel points per pixel (None : no decimation), with the
+        decimation method for analog values ("minmax" or "lttb", see make_plot).
         """
         r_list =[]
         title_list = []
@@ -222,12 +982,15 @@ class Recorder:
                 type_list.append(self.type_plot[v])
 
         self.fig = make_plot(
-            t=[l/1000 for l in self.snap_time],
+            t=self.snap_time,
+            time_scale=1/1000,
             list_y=r_list,
             title_text=self.title_graph,
             titles=tuple(title_list),
             graph_type=type_list,
-            height=h*300
+            height=h*300,
+            points_per_pixel=points_per_pixel,
+            decimation=decimation
         )
         self.fig.show()
 
@@ -252,10 +1015,14 @@ class Membrane(Observer, Notifier):
             - e : thickness (m) (default : 1e-5)
             - Y : young modulus (Pa)
             - alpha : time inertia coefficient (simulate delay)
+            - lazy : if True, the deflection is only computed when L_def or dL is read (once per tick at most),
+              the ticks without reading are caught up in closed form (and when P or T change, with the previous target).
 
     """
     # https://fr.wikipedia.org/wiki/Th%C3%A9orie_des_poutres
-    def __init__(self,E:Environment , EIgz, diameter, P_calib, e = 1e-5, Y = 130e9, alpha = 0.4):
+    settle_tolerance = 1e-12
+
+    def __init__(self,E:Environment , EIgz, diameter, P_calib, e = 1e-5, Y = 130e9, alpha = 0.4, lazy=False):
         super().__init__()
         E.bind_to(self)
         self.E = E
@@ -263,45 +1030,104 @@ class Membrane(Observer, Notifier):
         self.EIgz = EIgz
         self.S = (diameter/2)**2 *pi
         self.L = diameter
-        self.dL = 0
+        self.lazy = lazy
+        self._stale = False
+        self._pending_ticks = 0
+        self._dL = 0
         self.F = 0
         self.epais = e
         self.P_calib = P_calib
         self._L_def = diameter
+        self._target_L_def = diameter
+        self._target_key = None
         self.alpha = alpha
 
     @property
     def L_def(self):
+        if self._stale:
+            self._refresh()
         return self._L_def
     
     @L_def.setter
     def L_def(self, value):
         self._L_def = value
-        self.dL = value - self.L
+        self._dL = value - self.L
         self.notify()
 
+    @property
+    def dL(self):
+        if self._stale:
+            self._refresh()
+        return self._dL
+
+    @dL.setter
+    def dL(self, value):
+        self._dL = value
+
+    def _refresh(self):
+        """lazy mode : compute the deflection for all the ticks received since the last reading"""
+        self._stale = False
+        ticks, self._pending_ticks = self._pending_ticks, 0
+        muted, self._muted = self._muted, True
+        try:
+            self.compute_force()
+            self.compute_def_x(ticks)
+        finally:
+            self._muted = muted
+
     def compute_force(self):
         self.F = (self.E.P-self.P_calib)/self.S
 
-    def compute_def_z(self,x=None):
-        if x == None :
+    def compute_def_z(self,x=None, P=None):
+        if x is None :
             x = self.L/2
             # out = 
-        return  3*(self.E.P- self.P_calib) * ( 1 - 0.4**2 ) / (16 * self.Y*self.epais**3  ) * (self.L/2)**4
+        if P is None:
+            P = self.E.P
+        return  3*(P- self.P_calib) * ( 1 - 0.4**2 ) / (16 * self.Y*self.epais**3  ) * (self.L/2)**4
         # return 1/self.EIgz * (self.F/12*(x)**3-self.F*self.L**2*(x)/16)
 
     def check_state(self):
         return (self.L_def-self.L)/self.L
 
-    def compute_def_x(self,):
+    def compute_target_def_x(self, P=None, T=None):
         """
-        
+        length of the membrane once settled for the current environment (without time inertia).
+        P and T can be given (scalars or arrays) instead of the environment ones.
         """
-        y = self.compute_def_z()
+        if T is None:
+            T = self.E.T
+        y = self.compute_def_z(P=P)
 
         L_def = 2*(y**2+self.L**2/4)**.5
-        L_def *= (1+ 0.409e-6 + 0.686e-9*self.E.T)
-        self.L_def = self.alpha*self.L_def + (1-self.alpha)*L_def
+        L_def *= (1+ 0.409e-6 + 0.686e-9*T)
+        return L_def
+
+    def settled_def_x(self):
+        """
+        compute_target_def_x memoized on its inputs (P, T and membrane parameters) :
+        it is only computed again when one of them changes (P and T only change at experiment steps)
+        """
+        key = (self.E.P, self.E.T, self.P_calib, self.L, self.epais, self.Y)
+        if key != self._target_key:
+            self._target_key = key
+            self._settled_L_def = self.compute_target_def_x()
+        return self._settled_L_def
+
+    def compute_def_x(self, ticks=None):
+        """
+        update the membrane length after ticks time steps (default : ticks elapsed in the environment)
+        """
+        if ticks is None:
+            ticks = self.E.ticks_elapsed
+        L_def = self.settled_def_x()
+        previous = self.L_def
+        if ticks > 1:
+            # skipped ticks (event-driven run or lazy mode) : inertia towards the previous target, held meanwhile
+            held = self.alpha ** (ticks - 1)
+            previous = held*previous + (1-held)*self._target_L_def
+        self._target_L_def = L_def
+        self.L_def = self.alpha*previous + (1-self.alpha)*L_def
         return self.L_def
 
     def get_def_x(self):
@@ -310,7 +1136,39 @@ class Membrane(Observer, Notifier):
     
 
     def update(self,notifier):
-        _ = self.get_def_x()
+        if self.lazy:
+            ticks = self.E.ticks_elapsed
+            key = self._target_key
+            target = self.settled_def_x()
+            if self._target_key != key:
+                # inputs changed : the pending ticks (and the ticks skipped before this one) are caught up
+                # with the previous target before switching to the new one
+                held = self.alpha ** (self._pending_ticks + ticks - 1)
+                self._L_def = held*self._L_def + (1-held)*self._target_L_def
+                self._dL = self._L_def - self.L
+                self._target_L_def = target
+                self._pending_ticks = 1
+            else:
+                self._pending_ticks += ticks
+            self._stale = True
+            self.notify()
+        else:
+            _ = self.get_def_x()
+
+    def next_event(self, tg):
+        """next tick while the membrane is still settling, None once settled"""
+        if abs(self.settled_def_x() - self.L_def) > self.settle_tolerance * self.L:
+            return tg.current_time_index
+        return None
+
+    def update_block(self, notifier):
+        self.compute_force()
+        self._stale = False
+        self._pending_ticks = 0
+        L_def = lag_filter(self.compute_target_def_x(), self.alpha, np.ravel(self._L_def)[-1])
+        self._L_def = L_def
+        self.dL = L_def - self.L
+        self.notify_block()
 
 
 # Definition des objets du tp
@@ -327,9 +1185,10 @@ class Resistance(Observer):
     - K : jauge effect parameter
     - quality : quality of resistance in terms of noise : {"bad": 1e-2,"normal": 1e-3, "good": 1e-4, "high": 1e-5, "extra": 1e-6}
     - alpha : temperature effect
+    - lazy : if True, the value is only computed at the first reading (call or .resistance) after each update
     """
 
-    def __init__(self, E:Environment, R, L = 1e-2 , K=2, quality="good", alpha=0.0002): 
+    def __init__(self, E:Environment, R, L = 1e-2 , K=2, quality="good", alpha=0.0002, lazy=False): 
         d_quality = {"bad": 1e-2,"normal": 1e-3, "good": 1e-4, "high": 1e-5, "extra": 1e-6}
         if quality in d_quality:
             self.eps = d_quality[quality]
@@ -337,8 +1196,12 @@ class Resistance(Observer):
             self.eps = 1e-3
         E.bind_to(self)
         self.E = E
+        self.noise_stream = E.noise_stream()
         self.R = R
         self._resistance = R
+        self.lazy = lazy
+        self._stale = False
+        self._noiseless_key = None
         # self.T = E.T 
         self.L = L 
         self.dL = 0 
@@ -349,14 +1212,31 @@ class Resistance(Observer):
 
     @property
     def resistance(self):
+        if self._stale:
+            self._resistance = self.get_resistance()
+            self._stale = False
         return self._resistance
     
     @resistance.setter
     def resistance(self, value):
         self._resistance = value
+        self._stale = False
     
     def compute_R(self):
-        return self.R * (1 + self.dL/self.L *self.K) * (1 + self.alpha * self.E.T)*(1 + self.eps*(2*random()-1) )
+        # the deterministic part only changes with dL and T (or the parameters) : it is memoized, the noise is drawn each time
+        key = (self.dL, self.E.T, self.R, self.L, self.K, self.alpha)
+        if key != self._noiseless_key:
+            self._noiseless_key = key
+            self._noiseless_R = self.compute_noiseless_R()
+        return self._noiseless_R*(1 + self.eps*self.noise_stream() )
+
+    def compute_noiseless_R(self, dL=None, T=None):
+        """resistance without noise, dL and T can be given (scalars or arrays) instead of the current ones"""
+        if dL is None:
+            dL = self.dL
+        if T is None:
+            T = self.E.T
+        return self.R * (1 + dL/self.L *self.K) * (1 + self.alpha * T)
     
     def set_deformation(self, dL): 
         self.dL = dL 
@@ -376,7 +1256,19 @@ class Resistance(Observer):
     # def set_environnement(self, T): 
     #     self.T = T 
     def update(self, notifier: Notifier) -> None:
-        self.resistance = self.get_resistance()
+        if self.lazy:
+            self._stale = True
+        else:
+            self.resistance = self.get_resistance()
+
+    def next_event(self, tg):
+        return None
+
+    def update_block(self, notifier: Notifier) -> None:
+        if self.membrane != None:
+            self.set_deformation( self.side*(self.membrane.dL))
+        noise = self.noise_stream.draw(np.size(self.E.time))
+        self.resistance = self.compute_noiseless_R()*(1 + self.eps*noise)
 
     def get_resistance(self): 
         """
@@ -400,13 +1292,15 @@ class Generateur:
     Params : 
         - v_alim : output voltage
         - noise : noise (default : 1e-3)
+        - E : environment object, if given the noise stream is spawned from its seed (reproducible runs)
     """
-    def __init__(self, v_alim, noise=1e-3):
+    def __init__(self, v_alim, noise=1e-3, E:Environment=None):
         self.v_alim = v_alim
         self.noise = noise
+        self.noise_stream = NoiseStream() if E is None else E.noise_stream()
 
     def get_v_alim(self):
-        return self.v_alim *(1+ self.noise*(2*random()-1) )
+        return self.v_alim *(1+ self.noise*self.noise_stream() )
     
     __call__ = get_v_alim
 
@@ -434,6 +1328,11 @@ class Horloge(Observer, Notifier):
         self.factor = granularity_env_time
         self.value = False
         self._time = 0
+        # pulse when t % tf_s < 1, i.e. (t*2f) % granularity < 2f : exact on integer times if 2f and granularity are integers
+        if float(2*frequence).is_integer() and float(granularity_env_time).is_integer():
+            self._pulse_ratio = (int(2*frequence), int(granularity_env_time))
+        else:
+            self._pulse_ratio = None
    
     def update(self, notifier):
         self._time = notifier.time #/self.factor 
@@ -446,7 +1345,57 @@ class Horloge(Observer, Notifier):
 
     @property
     def pulse_clock(self):
-        return (int(self._time % self.tf_s) == 0)
+        return self.is_pulse_time(self._time)
+
+    def is_pulse_time(self, time):
+        if self._pulse_ratio is not None and type(time) is int:
+            num, granularity = self._pulse_ratio
+            return (time * num) % granularity < num
+        return (int(time % self.tf_s) == 0)
+
+    def pulse_indices(self, tg, start=0, stop=None):
+        """
+        indices of the real ticks of tg (between start and stop) where the clock switches, as an integer array.
+        The schedule is periodic and computed with integer arithmetic (no float modulo drift).
+        """
+        stop = tg.size_real if stop is None else min(stop, tg.size_real)
+        step = tg.real_time_step_ms
+        if self._pulse_ratio is None or not float(step).is_integer():
+            time = (np.arange(start, stop) * step).astype(np.int64)
+            return start + np.nonzero(np.floor(time % self.tf_s) == 0)[0]
+        num, granularity = self._pulse_ratio
+        step_num = int(step) * num
+        period = granularity // gcd(step_num, granularity)
+        offsets = np.nonzero((np.arange(period) * step_num) % granularity < num)[0]
+        bases = np.arange(start - start % period, stop, period)
+        index = (bases[:, None] + offsets[None, :]).ravel()
+        return index[(index >= start) & (index < stop)]
+
+    def edge_indices(self, tg, initial_value=False, start=0, stop=None):
+        """
+        indices of the real ticks of tg (between start and stop) where the clock rises (value becomes True),
+        for a run starting with the clock at initial_value. These are the ticks where CanCompare and
+        EchantillonneurBloqueur act (see CanCompare.convert_batch and EchantillonneurBloqueur.hold_batch).
+        """
+        pulses = self.pulse_indices(tg, stop=stop)
+        rising = pulses[1::2] if initial_value else pulses[0::2]
+        return rising[rising >= start]
+
+    def next_event(self, tg):
+        """index of the next real tick of tg where the clock switches"""
+        step = tg.real_time_step_ms
+        index = tg.current_time_index
+        if index < tg.size_real and self.is_pulse_time(int(index * step)):
+            return index
+        k = int(index * step // self.tf_s) + 1
+        while True:
+            tick = int(np.ceil(k * self.tf_s / step))
+            if tick >= tg.size_real:
+                return None
+            for candidate in (tick - 1, tick):
+                if candidate >= index and self.is_pulse_time(int(candidate * step)):
+                    return candidate
+            k += 1
     
     
     def update_clock(self):
@@ -504,6 +1453,43 @@ class EchantillonneurBloqueur:
             self.count = 0
         self.signal = self.horloge.get_pulse()
         return self.v_bloquee
+
+    def hold_batch(self, v_entree, edges):
+        """
+        Vectorized sample and hold : same result than calling get_echantillon(v_entree[i]) at each tick i,
+        the clock rising edges being at the tick indices edges (see Horloge.edge_indices).
+        v_entree can have leading dimensions (ex : (units, ticks)), time is the last axis.
+        The state (count, v_bloquee) is moved to the end of the batch so consecutive batches can be chained.
+
+        Output : blocked value at each tick (array with the shape of v_entree)
+        """
+        v_entree = np.asarray(v_entree, dtype=float)
+        edges = np.asarray(edges, dtype=np.int64)
+        if self.multiple <= 0:
+            # blocked at every tick : the output follows the input
+            if v_entree.shape[-1]:
+                self.count = 0
+                self.v_bloquee = v_entree[..., -1].copy() if v_entree.ndim > 1 else float(v_entree[-1])
+            return v_entree.copy()
+        step = self.multiple
+        if self.count >= self.multiple:
+            # already due : blocked at the first call
+            captures = np.concatenate(([0], edges[edges > 0][step - 1::step]))
+        else:
+            captures = edges[step - self.count - 1::step]
+
+        if captures.size:
+            self.count = int(np.count_nonzero(edges > captures[-1]))
+        else:
+            self.count += edges.size
+        previous = np.asarray(self.v_bloquee, dtype=float)[..., None]
+        if captures.size:
+            tick_capture = np.searchsorted(captures, np.arange(v_entree.shape[-1]), side="right") - 1
+            held = np.where(tick_capture >= 0, v_entree[..., captures[np.maximum(tick_capture, 0)]], previous)
+        else:
+            held = np.broadcast_to(previous, v_entree.shape).copy()
+        self.v_bloquee = held[..., -1] if held.ndim > 1 else float(held[-1])
+        return held
     # def get_echantillon(self, v_entree):
     #     """
     #     get blocked value of your v_entree (input signal)
@@ -588,6 +1574,75 @@ class CanCompare():
     @property
     def internal(self):
         return self.get_v_numerisee_courante()
+
+    def code(self, v_m):
+        """
+        final code of a complete conversion of v_m (largest qs with qs*quantum < v_m), v_m can be an array.
+        NaN gives 0 : every comparison of compare is false, so no bit is set.
+        """
+        q_max = (1 << self.resolution) - 1
+        c = np.ceil(np.asarray(v_m, dtype=float) / self.quantum) - 1
+        c = np.clip(np.where(np.isnan(c), 0, c), 0, q_max).astype(np.int64)
+        # ceil of the division can be one quantum off : check with the comparison of compare
+        c = np.where((c < q_max) & ((c + 1) * self.quantum < v_m), c + 1, c)
+        c = np.where((c > 0) & (c * self.quantum >= v_m), c - 1, c)
+        return c
+
+    def convert_batch(self, v_hold, edges):
+        """
+        Vectorized conversion : same result than calling compare(v_hold[i]) then reading qs, out and internal
+        at each tick i, the clock rising edges being at the tick indices edges (see Horloge.edge_indices).
+        The conversion restarts when the input changes and out holds the last complete conversion.
+        v_hold can have leading dimensions (ex : (units, ticks)), time is the last axis.
+        The CAN state is moved to the end of the batch (arrays per unit if v_hold has leading dimensions),
+        so consecutive batches can be chained.
+
+        Params :
+            - v_hold : input voltage at each tick (array)
+            - edges : increasing indices of the ticks where the clock rises
+
+        Output : (qs, out, internal) arrays with the shape of v_hold
+        """
+        v_hold = np.asarray(v_hold, dtype=float)
+        edges = np.asarray(edges, dtype=np.int64)
+        lead = v_hold.shape[:-1]
+        res = self.resolution
+        qs0 = np.broadcast_to(np.asarray(self.qs, dtype=np.int64), lead)
+        nb0 = np.broadcast_to(np.asarray(self.nb, dtype=np.int64), lead)
+        out0 = np.where(nb0 > res, qs0 * self.quantum, np.broadcast_to(self.v, lead))
+
+        v_edges = v_hold[..., edges]
+        k = np.arange(edges.size)
+        previous = np.concatenate((np.broadcast_to(self.check_v_change, lead)[..., None], v_edges[..., :-1]), axis=-1)
+        start = np.maximum.accumulate(np.where(v_edges != previous, k, -1), axis=-1)
+        done_before = np.where(start < 0, np.minimum(nb0 - 1, res)[..., None], 0)
+        done = np.minimum(done_before + k - np.maximum(start, 0) + 1, res)
+
+        code = self.code(v_edges)
+        shift = res - done
+        qs_edges = (code >> shift) << shift
+        last_complete = np.maximum.accumulate(np.where(done == res, k, -1), axis=-1)
+        out_edges = np.where(last_complete >= 0,
+                             np.take_along_axis(qs_edges * self.quantum, np.maximum(last_complete, 0), axis=-1),
+                             out0[..., None])
+
+        tick_edge = np.searchsorted(edges, np.arange(v_hold.shape[-1]), side="right") - 1
+        started = tick_edge >= 0
+        tick_edge = np.maximum(tick_edge, 0)
+        if edges.size:
+            qs = np.where(started, qs_edges[..., tick_edge], qs0[..., None])
+            out = np.where(started, out_edges[..., tick_edge], out0[..., None])
+            state = (qs_edges[..., -1], done[..., -1] + 1, v_edges[..., -1], out_edges[..., -1])
+        else:
+            qs = np.broadcast_to(qs0[..., None], v_hold.shape).copy()
+            out = np.broadcast_to(out0[..., None], v_hold.shape).copy()
+            state = (qs0, nb0, np.broadcast_to(self.check_v_change, lead), out0)
+
+        if lead:
+            self.qs, self.nb, self.check_v_change, self.v = (np.array(x) for x in state)
+        else:
+            self.qs, self.nb, self.check_v_change, self.v = int(state[0]), int(state[1]), float(state[2]), float(state[3])
+        return qs, out, qs * self.quantum
     
     __call__ = compare
 
@@ -600,6 +1655,7 @@ class Cpu():
         perform more intensitve calculus. Here the altimeter formula is implemented.
         Use check_value method for general input. It launches a two step process : correction (calibration) then compute method
         Inside you can use method "calibrate" to add regression coefficient obtained with numpy.polyfit
+        (or fitted on a simulated sweep with simulation.calibrate_cpu)
 
     Params : 
         - E : environment object
@@ -641,30 +1697,74 @@ class Cpu():
     def set_value_can(self, value_can):
         self.value_can = value_can
 
-    def correction(self):
-        # reg = [17905.19555648, 14468.22756158]
-        # self.pression = self.value_can *reg[0] + reg[1] 
-        # reg = [ 94.95021929  ,-626.54622693,  2315.98491463, 10241.5233834,22504.35066598]
-        
-        if isinstance(self.coefficient_correction, (float, int)):
-            self.coefficient_correction = [self.coefficient_correction]
-
-        if isinstance(self.coefficient_correction, (list, ndarray)):
-            degree = len(self.coefficient_correction)
-            self.pression = 0
-            for i in range(0,degree):
-                self.pression += self.value_can**(degree-i-1) * self.coefficient_correction[i]
-
-        else:
-            self.pression = self.value_can
+    @property
+    def coefficient_correction(self):
+        return self._coefficient_correction
+
+    @coefficient_correction.setter
+    def coefficient_correction(self, coef):
+        # kept as given, the Horner-ready form is normalized once here (highest degree first, as numpy.polyfit) :
+        # a number is a constant, None means no correction. A 2-D array is a temperature compensated calibration :
+        # row i gives, as a polynomial of T, the coefficient of value_can**(degree-i)
+        self._horner_coefficients = None
+        self._horner_rows = None
+        if isinstance(coef, (float, int, list, tuple, ndarray)):
+            coef_array = np.atleast_1d(np.asarray(coef, dtype=float))
+            if coef_array.ndim == 2:
+                self._horner_rows = coef_array.tolist()
+            else:
+                self._horner_coefficients = coef_array.tolist()
+        self._coefficient_correction = coef
+
+    @staticmethod
+    def _horner(coefficients, x):
+        if isinstance(x, ndarray):
+            # in place to avoid one temporary array per degree
+            result = np.full(np.broadcast_shapes(x.shape, np.shape(coefficients[0])), coefficients[0], dtype=float)
+            for c in coefficients[1:]:
+                result *= x
+                result += c
+            return result
+        result = 0.
+        for c in coefficients:
+            result = result*x + c
+        return result
+
+    def calibration(self, value_can, T=None):
+        """
+        pressure for value_can (number or array) with the calibration polynomial, evaluated with the Horner scheme.
+        For a temperature compensated calibration, T is the temperature (default : the environment one).
+        """
+        coefficients = self._horner_coefficients
+        if self._horner_rows is not None:
+            T = self.E.T if T is None else T
+            coefficients = [self._horner(row, T) for row in self._horner_rows]
+        if coefficients is None:
+            return value_can
+        return self._horner(coefficients, value_can)
 
-        # self.pression = self.value_can**4 *reg[0] + self.value_can**3 *reg[1] +self.value_can**2 *reg[2] + self.value_can**1 *reg[3] + reg[4] 
+    def correction(self):
+        self.pression = self.calibration(self.value_can)
 
     def calibrate(self,coef):
         self.coefficient_correction = coef
 
+    @staticmethod
+    def altitude_from(pression):
+        """altimeter formula (number or array)"""
+        return 288.15/0.0065*(1-(pression/1.013e5)**(1/5.255))
+
     def compute(self):
-        self.altitude = 288.15/0.0065*(1-(self.pression/1.013e5)**(1/5.255))
+        self.altitude = self.altitude_from(self.pression)
+
+    def convert(self, values_can, T=None):
+        """
+        batch version of process, the cpu state is not changed.
+        Return (pression, altitude) arrays for an array of CAN outputs (and temperatures T for a temperature
+        compensated calibration).
+        """
+        pression = self.calibration(np.asarray(values_can, dtype=float), T)
+        return pression, self.altitude_from(pression)
 
     __call__ = check_value
         
@@ -673,8 +1773,35 @@ class Cpu():
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
-def make_plot(t, list_y, titles=(), graph_type=None, height=600, width=600, title_text="Stacked Subplots"):
+def _is_group(y):
+    """True if y holds several series (list of series or 2D array), decided from the container only"""
+    if isinstance(y, ndarray):
+        return y.ndim == 2
+    return isinstance(y, (list, tuple)) and len(y) > 0 and isinstance(y[0], (list, tuple, ndarray))
+
+
+def _plot_series(t, y, shape, max_points, decimation):
+    """series given to plotly, decimated to max_points if needed (non numeric series are kept as is)"""
+    if max_points is None or len(y) <= max_points:
+        return t, y
+    try:
+        return decimate(t, y, max_points, decimation, step=shape == 'hv')
+    except (TypeError, ValueError):
+        return t, y
+
+
+def _trace(x, y, name, step, webgl_threshold):
+    """Scatter trace, Scattergl (without spline smoothing) above webgl_threshold points"""
+    large = webgl_threshold is not None and len(y) > webgl_threshold
+    if step:
+        shape = 'hv'
+    else:
+        shape = 'linear' if large else 'spline'
+    scatter = go.Scattergl if large else go.Scatter
+    return scatter(x=x, y=y, name=name, line={"shape": shape})
+
 
+def make_plot(t, list_y, titles=(), graph_type=None, height=600, width=600, title_text="Stacked Subplots", points_per_pixel=None, decimation="minmax", webgl_threshold=5000, time_scale=1):
     """
     Description : 
         function for plotting simply variables as lists of numbers. The variable x is the same for all the graphics.
@@ -684,10 +1811,18 @@ def make_plot(t, list_y, titles=(), graph_type=None, height=600, width=600, titl
         - t : common time value for all graphs
         - list_y : list of y values of the different graphs to plot
         - titles : tuple of the titles for each graphics. Warning : a lot of errors comes from list_y, titles or graph_type which do not have the same length.
-        - graph_type : True for step graph (simulate numeric value), False for spline graph (simulate analogic value)
+        - graph_type : True for step graph (simulate numeric value), False for spline graph (simulate analogic value),
+          None : all graphs are analogic
         - height : height of the whole generated graph
         - width : width of the whole generated graph
         - title_text : title of the whole generated graph
+        - points_per_pixel : if given, series longer than width x points_per_pixel are decimated (see tools.decimate),
+          so the cost of the graph does not depend on the length of the run
+        - decimation : "minmax" (envelope) or "lttb" for analog series, step series keep all their transitions
+        - webgl_threshold : series with more points (after decimation) are drawn with WebGL (go.Scattergl)
+          and without spline smoothing (None : always SVG)
+        - time_scale : factor applied to t after the decimation (ex : 1/1000 for a time base in ms),
+          so a long memory-mapped time base is not copied
 
     Example :
         fig = instruments.make_plot(
@@ -713,45 +1848,28 @@ def make_plot(t, list_y, titles=(), graph_type=None, height=600, width=600, titl
                 )
     """
 
-
     rows = len(list_y)
+    max_points = None if points_per_pixel is None else int(width*points_per_pixel)
     fig = make_subplots(rows=rows, cols=1, subplot_titles = [str(t) for t in titles])
 
-    i = 0
-    
-    for y in list_y:
-        i += 1
-
-
-
-        if any(isinstance(el, list) for el in y):
-            j=0
-            for yy in y:
-                j += 1
-                if graph_type is not None:
-                    if graph_type[i-1][j-1]:
-                        shape = 'hv'
-                    else:
-                        shape = 'spline'
-                fig.append_trace(go.Scatter(
-                    x=t,
-                    y=yy,
-                    name = titles[i-1][j-1],
-                    line= {"shape": shape},
-                ), row=i, col=1)
-        else:
-            if graph_type is not None:    
-                if graph_type[i-1]:
-                        shape = 'hv'
-                else:
-                    shape = 'spline'
-            fig.append_trace(go.Scatter(
-                x=t,
-                y=y,
-                name = titles[i-1],
-                line= {"shape": shape},
-            ), row=i, col=1)
-
+    # all the traces are built first then added at once : one layout update instead of one per trace
+    traces = []
+    trace_rows = []
+    for i, y in enumerate(list_y):
+        group = _is_group(y)
+        series = y if group else [y]
+        names = titles[i] if i < len(titles) else None
+        names = names if group else (names,)
+        types = graph_type[i] if graph_type is not None else None
+        types = types if group else (types,)
+        for j, yy in enumerate(series):
+            step = bool(types[j]) if types is not None else False
+            x, yy = _plot_series(t, yy, 'hv' if step else 'spline', max_points, decimation)
+            x = x if time_scale == 1 else np.asarray(x)*time_scale
+            name = names[j] if names is not None and j < len(names) else None
+            traces.append(_trace(x, yy, name, step, webgl_threshold))
+            trace_rows.append(i + 1)
+    fig.add_traces(traces, rows=trace_rows, cols=[1]*len(traces))
 
     fig.update_layout(height=height, width=width, title_text=title_text)
     return fig
@@ -0,0 +1,203 @@
+"""
+This module provides a live view of a Recorder during a run : a monitoring thread reads the snapshots
+recorded since its previous update, decimates them and sends them to sinks (plotly FigureWidget in a notebook,
+local Dash app...), so the simulation loop never waits for the rendering.
+"""
+
+import queue
+import threading
+import warnings
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from sensorsim.instruments import Recorder
+from sensorsim.tools import decimate
+
+
+class LiveMonitor:
+    """
+    Description :
+        Throttled live monitoring of a Recorder : every interval seconds, a background thread takes the snapshots
+        recorded since the previous update (Recorder.read_since), decimates each channel to points_per_update points
+        (tools.decimate, transitions kept for step channels) and gives them to each sink as sink(increment),
+        increment being {key: (time (s), values)}. Only the new points are sent, never the whole recording.
+        With a columnar storage, snapshots are visible once written in the columns (every chunk_size snapshots).
+
+    Params :
+        - recorder : Recorder of the run
+        - sinks : callables sink(increment), ex : FigureWidgetSink, DashSink
+        - keys : recordings to monitor (default : all)
+        - interval : time between two updates (s)
+        - points_per_update : maximum number of points sent per channel and per update
+
+    Example :
+        sink = live.FigureWidgetSink(r)
+        display(sink.figure)
+        with live.LiveMonitor(r, [sink], interval=0.5):
+            for tt in tg:
+                ...
+                r.sample()
+    """
+    def __init__(self, recorder:Recorder, sinks:List[Callable], keys=None, interval=0.5, points_per_update=500) -> None:
+        self.recorder = recorder
+        self.sinks = list(sinks)
+        self.keys = keys
+        self.interval = interval
+        self.points_per_update = points_per_update
+        self.position = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """send the snapshots recorded since the previous update to the sinks, return their number"""
+        stop, time, values = self.recorder.read_since(self.position)
+        count = stop - self.position
+        self.position = stop
+        if count <= 0:
+            return 0
+        keys = values.keys() if self.keys is None else [k for k in self.keys if k in values]
+        increment = {}
+        for k in keys:
+            step = bool(self.recorder.type_plot.get(k))
+            increment[k] = decimate(time / 1000, values[k], self.points_per_update, step=step)
+        for sink in self.sinks:
+            try:
+                sink(increment)
+            except Exception as e:
+                warnings.warn(f"live sink {sink} failed : {e}")
+        return count
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        """start the monitoring thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sensorsim-live", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop the monitoring thread and send the last snapshots (call it once the run is over)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        store = getattr(self.recorder, "_store", None)
+        if store is not None:
+            store.flush()
+        self.poll()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FigureWidgetSink:
+    """
+    Live plotly FigureWidget (notebook) with one graph per monitored recording : at each update the new points are
+    joined to the series kept by the sink and the traces are replaced inside one batch_update, so the whole kept
+    series is sent to the front end (FigureWidget has no extend). Each trace keeps at most max_points points
+    (older points are decimated again), so this data stays bounded during long runs ; DashSink sends the new
+    points only. Needs ipywidgets (anywidget with plotly >= 6).
+
+    Params :
+        - recorder : Recorder giving the names and types of graph of the recordings
+        - keys : recordings to show (default : all)
+        - max_points : maximum number of points per trace
+    """
+    def __init__(self, recorder:Recorder, keys=None, max_points=5000, height_per_graph=250) -> None:
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        self.keys = list(recorder.name_recordings) if keys is None else list(keys)
+        self.step = {k: bool(recorder.type_plot.get(k)) for k in self.keys}
+        self.max_points = max_points
+        figure = make_subplots(rows=len(self.keys), cols=1, shared_xaxes=True,
+                               subplot_titles=[str(recorder.name_recordings.get(k, k)) for k in self.keys])
+        figure.add_traces([go.Scattergl(x=[], y=[], name=str(recorder.name_recordings.get(k, k)),
+                                        line={"shape": "hv" if self.step[k] else "linear"}) for k in self.keys],
+                          rows=list(range(1, len(self.keys) + 1)), cols=[1]*len(self.keys))
+        figure.update_layout(height=height_per_graph*len(self.keys), title_text=recorder.title_graph)
+        self.figure = go.FigureWidget(figure)
+        self._series = {k: (np.empty(0), np.empty(0)) for k in self.keys}
+
+    def __call__(self, increment:Dict):
+        with self.figure.batch_update():
+            for trace, k in zip(self.figure.data, self.keys):
+                if k not in increment:
+                    continue
+                t, y = (np.concatenate(v) for v in zip(self._series[k], increment[k]))
+                if t.size > self.max_points:
+                    t, y = decimate(t, y, self.max_points // 2, step=self.step[k])
+                self._series[k] = (t, y)
+                trace.x, trace.y = t, y
+
+
+class DashSink:
+    """
+    Live graph in a local Dash app (http://127.0.0.1:port) : updates are queued by the monitor and sent to the
+    browser with the extendData property of the graph, so each refresh only carries the new points.
+    The server runs in a daemon thread. Needs dash.
+
+    Params :
+        - recorder : Recorder giving the names of the recordings
+        - keys : recordings to show (default : all)
+        - refresh_ms : refresh period of the page
+        - max_points : maximum number of points kept per trace in the browser
+    """
+    def __init__(self, recorder:Recorder, keys=None, refresh_ms=1000, max_points=20000) -> None:
+        import plotly.graph_objects as go
+        from dash import Dash, Input, Output, dcc, html, no_update
+
+        self.keys = list(recorder.name_recordings) if keys is None else list(keys)
+        self.max_points = max_points
+        self.updates = queue.Queue()
+        figure = go.Figure([go.Scattergl(x=[], y=[], name=str(recorder.name_recordings.get(k, k)),
+                                         line={"shape": "hv" if recorder.type_plot.get(k) else "linear"}) for k in self.keys])
+        figure.update_layout(title_text=recorder.title_graph)
+        self.app = Dash(__name__)
+        self.app.layout = html.Div([dcc.Graph(id="live-graph", figure=figure),
+                                    dcc.Interval(id="live-interval", interval=refresh_ms)])
+
+        @self.app.callback(Output("live-graph", "extendData"), Input("live-interval", "n_intervals"))
+        def extend(_):
+            data = self.pending()
+            return no_update if data is None else data
+
+        self._thread = None
+
+    def __call__(self, increment:Dict):
+        self.updates.put(increment)
+
+    def pending(self):
+        """extendData of the queued updates (None if there are none)"""
+        x = {k: [] for k in self.keys}
+        y = {k: [] for k in self.keys}
+        empty = True
+        while True:
+            try:
+                increment = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            for k in self.keys:
+                if k in increment:
+                    x[k].append(increment[k][0])
+                    y[k].append(increment[k][1])
+                    empty = False
+        if empty:
+            return None
+        indices = list(range(len(self.keys)))
+        join = lambda parts: np.concatenate(parts).tolist() if parts else []
+        return ({"x": [join(x[k]) for k in self.keys], "y": [join(y[k]) for k in self.keys]}, indices, self.max_points)
+
+    def run(self, port=8050):
+        """start the Dash server in a daemon thread"""
+        self._thread = threading.Thread(target=self.app.run, kwargs={"port": port, "debug": False}, daemon=True)
+        self._thread.start()
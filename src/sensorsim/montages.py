@@ -1,18 +1,32 @@
 """
 This module provides some classical electronic circuits as functions and the sensor membrane
 
+Every input can be a number, a numpy array or an object called to get its value (Resistance, Generateur) :
+arrays are broadcast together, so a single call can evaluate a circuit over a whole timeline or over many
+candidate resistance sets (ex : resistances of shape (N, 1) and voltage of shape (T,) give a (N, T) output).
 """
 
+import numpy as np
 
 
 
 
+def _value(x):
+    """value of a circuit input : objects are called, lists and tuples become numpy arrays"""
+    if callable(x):
+        x = x()
+    if isinstance(x, (list, tuple)):
+        x = np.asarray(x, dtype=float)
+    return x
+
+
 class Wheastone:
     """
     Object Wheastone : simulate wheastone bridge
     
     Params:
     - R1,R2,R3,R4: the 4 resistances of the bridge. Several resistances can be sensitive or not.
+      They can be Resistance objects, numbers or arrays.
 
     You can after initialization use it but you have to give a generator in input.
     Ex: 
@@ -26,10 +40,18 @@ class Wheastone:
         self.R3 = R3
         self.R4 = R4
     def wheastone(self, V_0):
-        Vs = V_0 * (self.R4()/(self.R1()+self.R4())-self.R3()/(self.R2()+self.R3()))
-        return Vs
+        return wheastone_bridge(V_0, self.R1, self.R2, self.R3, self.R4)
     __call__=wheastone
 
+def wheastone_bridge(V_0, R1, R2, R3, R4):
+    """
+    output voltage of a wheastone bridge supplied with V_0, for the resistances R1, R2, R3, R4
+    (numbers, numpy arrays broadcast together, or Resistance objects)
+    """
+    V_0, R1, R2, R3, R4 = (_value(x) for x in (V_0, R1, R2, R3, R4))
+    Vs = V_0 * (R4/(R1+R4)-R3/(R2+R3))
+    return Vs
+
 def montage_ampli_op(V1,V2,R1,R2,R3,R4):
 
     """
@@ -39,7 +61,8 @@ def montage_ampli_op(V1,V2,R1,R2,R3,R4):
     Params : 
         - V_1, V_2 input voltage
         - R1, R2, R3, R4 the resistances
+    All can be numbers, numpy arrays (broadcast together) or objects giving their value when called.
     """
-
+    V1, V2, R1, R2, R3, R4 = (_value(x) for x in (V1, V2, R1, R2, R3, R4))
     Vs = (R1+R2)/R1 * R4/(R3+R4) * V2 - R2/R1*V1
-    return Vs
\ No newline at end of file
+    return Vs
@@ -0,0 +1,154 @@
+"""
+This module provides an on-disk format for recorded runs : a directory with one raw binary column per channel
+(float64, little endian) and a JSON header (names, type of graph, time base). Columns are written by chunks during
+the run (see Recorder.stream_to) and reopened with numpy.memmap, so long recordings are analyzed and plotted
+without being loaded in memory (see Recorder.open).
+
+Layout :
+    run_directory/
+        header.json
+        snap_time.bin
+        channel_0.bin
+        channel_1.bin
+        ...
+"""
+
+import json
+import os
+from typing import Dict
+
+import numpy as np
+
+FORMAT = "sensorsim-run"
+VERSION = 1
+DTYPE = "<f8"
+HEADER = "header.json"
+TIME_FILE = "snap_time.bin"
+
+
+def _write_header(path, header):
+    tmp = os.path.join(path, HEADER + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(header, f, indent=1)
+    os.replace(tmp, os.path.join(path, HEADER))
+
+
+def read_header(path) -> Dict:
+    with open(os.path.join(path, HEADER)) as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a {FORMAT} directory")
+    return header
+
+
+class RunWriter:
+    """
+    Streaming writer of a run directory : each call of write appends a chunk of rows to the column files,
+    the header is updated with the number of rows so the run can be reopened while it is written.
+
+    Params :
+        - path : run directory (created, an existing run is overwritten)
+        - keys : channels ids
+        - name_recordings : {key: name in graph}
+        - type_plot : {key: True for step graph (numeric value), False for analog}
+        - timebase : time parameters of the run (ex : {"tmax_second": 60, "experiment_step_ms": 1000, "real_time_step_ms": 10})
+        - title : title of the graphs
+
+    Example :
+        with RunWriter("run_1", ["P", "V_gain"]) as writer:
+            for block in ...:
+                writer.write(time, {"P": P, "V_gain": V_gain})
+    """
+    def __init__(self, path, keys, name_recordings=None, type_plot=None, timebase=None, title="Recorder graphs") -> None:
+        name_recordings = {} if name_recordings is None else name_recordings
+        type_plot = {} if type_plot is None else type_plot
+        self.path = path
+        self.keys = list(keys)
+        self.length = 0
+        os.makedirs(path, exist_ok=True)
+        self.header = {
+            "format": FORMAT,
+            "version": VERSION,
+            "dtype": DTYPE,
+            "length": 0,
+            "title": title,
+            "timebase": timebase,
+            "time_file": TIME_FILE,
+            "channels": [{"key": k, "name": name_recordings.get(k, k), "type_plot": type_plot.get(k),
+                          "file": f"channel_{i}.bin"} for i, k in enumerate(self.keys)],
+        }
+        self._time = open(os.path.join(path, TIME_FILE), "wb")
+        self._files = [open(os.path.join(path, c["file"]), "wb") for c in self.header["channels"]]
+        _write_header(path, self.header)
+
+    def write(self, time, columns:Dict):
+        """append a chunk : time (n values) and columns {key: n values}, missing keys are written as NaN"""
+        time = np.asarray(time, dtype=DTYPE)
+        chunk = []
+        for k in self.keys:
+            values = columns.get(k)
+            values = np.full(time.size, np.nan, dtype=DTYPE) if values is None else np.asarray(values, dtype=DTYPE)
+            if values.shape != time.shape:
+                raise ValueError(f"{k} has {values.size} values for {time.size} times")
+            chunk.append(values)
+        time.tofile(self._time)
+        for values, f in zip(chunk, self._files):
+            values.tofile(f)
+        self.length += time.size
+        for f in [self._time] + self._files:
+            f.flush()
+        self.header["length"] = self.length
+        _write_header(self.path, self.header)
+
+    def close(self):
+        for f in [self._time] + self._files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _column(path, file, length):
+    if length == 0:
+        return np.empty(0, dtype=DTYPE)
+    return np.memmap(os.path.join(path, file), dtype=DTYPE, mode="r", shape=(length,))
+
+
+class RunFile:
+    """
+    Run directory opened with numpy.memmap (read only) : time and columns are read from the disk on access.
+    It has the storage interface of the Recorder (see Recorder.open).
+
+    Params :
+        - path : run directory written by RunWriter
+    """
+    def __init__(self, path) -> None:
+        self.path = path
+        self.header = read_header(path)
+        self.size = self.header["length"]
+        self.keys = [c["key"] for c in self.header["channels"]]
+        self.name_recordings = {c["key"]: c["name"] for c in self.header["channels"]}
+        self.type_plot = {c["key"]: c["type_plot"] for c in self.header["channels"]}
+        self.time = _column(path, self.header["time_file"], self.size)
+        self._columns = {c["key"]: _column(path, c["file"], self.size) for c in self.header["channels"]}
+
+    def flush(self):
+        pass
+
+    def columns(self):
+        return dict(self._columns)
+
+    def times(self):
+        return self.time
+
+    def rows_since(self, start):
+        return self.size, self.time[start:], [self._columns[k][start:] for k in self.keys]
+
+    def append(self, time, values):
+        raise TypeError(f"{self.path} is opened read only")
+
+    def add_key(self, key):
+        raise TypeError(f"{self.path} is opened read only")
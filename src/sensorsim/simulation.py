@@ -0,0 +1,318 @@
+"""
+This module provides vectorized simulation engines : a whole run is computed with numpy arrays
+instead of the tick by tick loop (for tt in tg: ...) when only the final time series are needed.
+"""
+
+import copy
+from contextlib import contextmanager
+from typing import Dict
+
+import numpy as np
+
+from sensorsim import montages
+from sensorsim.instruments import CanCompare, Cpu, EchantillonneurBloqueur, Generateur, NoiseStream, Resistance, TestEnclosure, TimeGenerator, column_statistics, merge_statistics
+from sensorsim.tools import compute_error, lag_filter
+
+
+def _resistance_block(resistance:Resistance, T, dL_membranes, noise):
+    """values of a Resistance over a block, dL_membranes maps id(membrane) to its elongation"""
+    if resistance.membrane is not None:
+        dL = resistance.side * dL_membranes[id(resistance.membrane)]
+    else:
+        dL = resistance.dL
+    return resistance.compute_noiseless_R(dL=dL, T=T) * (1 + resistance.eps*noise)
+
+
+def _stream_noise(component, size):
+    return component.noise_stream.draw(size)
+
+
+def _membranes(bridge):
+    """membranes attached to the bridge resistances"""
+    membranes = []
+    for resistance in bridge:
+        if resistance.membrane is not None and not any(resistance.membrane is m for m in membranes):
+            membranes.append(resistance.membrane)
+    return membranes
+
+
+def _analog_block(P, T, bridge, ampli, gen:Generateur, gen_ao:Generateur, membranes, L_last, noise=_stream_noise):
+    """
+    analog chain over a block of ticks (time on the last axis of P and T).
+    L_last holds the membranes inertia state (by id) and is updated, noise(component, size) gives the noise draws.
+    Return (L_def of the first membrane or None, [R1, R2, R3, R4], V_mesure, V_gain)
+    """
+    size = np.shape(P)[-1]
+    dL_membranes = {}
+    first_L_def = None
+    for m in membranes:
+        L_def = lag_filter(m.compute_target_def_x(P=P, T=T), m.alpha, L_last[id(m)])
+        L_last[id(m)] = L_def[..., -1]
+        dL_membranes[id(m)] = L_def - m.L
+        if first_L_def is None:
+            first_L_def = L_def
+
+    R = [_resistance_block(r, T, dL_membranes, noise(r, size)) for r in bridge]
+    V_mesure = montages.wheastone_bridge(gen.v_alim * (1 + gen.noise*noise(gen, size)), *R)
+    R_ao = [_resistance_block(r, T, dL_membranes, noise(r, size)) for r in ampli]
+    V_gain = montages.montage_ampli_op(gen_ao.v_alim * (1 + gen_ao.noise*noise(gen_ao, size)), V_mesure, *R_ao)
+    return first_L_def, R, V_mesure, V_gain
+
+
+def simulate_analog(tg:TimeGenerator, enclosure:TestEnclosure, wheastone:montages.Wheastone, gen:Generateur, ampli, gen_ao:Generateur, chunk_size=65536) -> Dict[str, np.ndarray]:
+    """
+    Description :
+        Compute the analog part of the sensor chain (membrane, wheastone bridge, amplification stage) for the whole run.
+        It gives the same series than the tick by tick loop :
+            for tt in tg:
+                V_mesure = wheastone(gen())
+                V_gain = montages.montage_ampli_op(gen_ao(), V_mesure, R1_ao(), R2_ao(), R3_ao(), R4_ao())
+        The membrane time inertia is computed as a recursive filter (tools.lag_filter).
+        Noise is drawn from the noise streams of the components : with a seeded Environment and a compiled
+        time generator (tg.compile(), one draw per component and per tick), the loop gives the same values.
+        The membranes are the ones attached to the bridge resistances, they start from their current state.
+
+    Params :
+        - tg : time generator of the run
+        - enclosure : test enclosure giving the P and T profiles
+        - wheastone : montages.Wheastone object made of Resistance objects
+        - gen : generator of the bridge
+        - ampli : tuple of the 4 Resistance of the amplification stage (R1, R2, R3, R4 of montage_ampli_op)
+        - gen_ao : generator of the amplification stage (V1 of montage_ampli_op)
+        - chunk_size : number of ticks computed at once (bounds memory use of intermediate arrays)
+
+    Output : dict of arrays over tg.t_real with keys "time", "P", "T", "R1", "R2", "R3", "R4", "V_mesure", "V_gain"
+    and "L_def" (elongation of the first membrane) if a bridge resistance is attached to a membrane.
+
+    Example :
+        out = simulation.simulate_analog(tg, TE, wheastone, gen, (R1_ao, R2_ao, R3_ao, R4_ao), gen_ao)
+        fig = instruments.make_plot(out["time"]/1000, [out["V_gain"]], titles=("V_gain",))
+    """
+    bridge = (wheastone.R1, wheastone.R2, wheastone.R3, wheastone.R4)
+    membranes = _membranes(bridge)
+    L_last = {id(m): np.ravel(m._L_def)[-1] for m in membranes}
+
+    names = ["time", "P", "T", "R1", "R2", "R3", "R4", "V_mesure", "V_gain"] + (["L_def"] if membranes else [])
+    out = {k: np.empty(tg.size_real) for k in names}
+    out["time"] = np.empty(tg.size_real, dtype=np.int64)
+
+    for block in tg.blocks(chunk_size):
+        sl = slice(block.index[0], block.index[-1] + 1)
+        P, T = enclosure.get_env(block.exp_index)
+        L_def, R, V_mesure, V_gain = _analog_block(P, T, bridge, ampli, gen, gen_ao, membranes, L_last)
+
+        if L_def is not None:
+            out["L_def"][sl] = L_def
+        out["time"][sl] = block.time
+        out["P"][sl] = P
+        out["T"][sl] = T
+        for k, v in zip(("R1", "R2", "R3", "R4"), R):
+            out[k][sl] = v
+        out["V_mesure"][sl] = V_mesure
+        out["V_gain"][sl] = V_gain
+    return out
+
+
+@contextmanager
+def _unit_parameters(components, variations):
+    """temporarily set the per-unit parameters : variations {"name.attribute": array of size n_units}"""
+    saved = []
+    try:
+        for key, values in variations.items():
+            name, attribute = key.split(".")
+            if name not in components:
+                raise KeyError(f"unknown component {name} in {key}, expected one of {sorted(components)}")
+            targets = [components[name]]
+            if name == "membrane" and attribute == "L":
+                # resistances attached to the membrane take its length (see Resistance.attach_membrane)
+                targets += [r for r in components.values() if getattr(r, "membrane", None) is components[name]]
+            for target in targets:
+                saved.append((target, attribute, getattr(target, attribute)))
+                setattr(target, attribute, np.asarray(values, dtype=float)[:, None])
+        yield
+    finally:
+        for target, attribute, value in reversed(saved):
+            setattr(target, attribute, value)
+
+
+def run_ensemble(tg:TimeGenerator, enclosure:TestEnclosure, wheastone:montages.Wheastone, gen:Generateur, ampli, gen_ao:Generateur,
+                 sampler:EchantillonneurBloqueur, can:CanCompare, cpu:Cpu, n_units, variations=None, seed=None, chunk_size=8192, warmup_s=None) -> Dict[str, np.ndarray]:
+    """
+    Description :
+        Monte Carlo simulation of n_units sensors built like the given chain (the chain of test_loop.py),
+        evaluated together as (units x ticks) arrays, chunk by chunk over time so memory is bounded by n_units*chunk_size.
+        Each unit has its own noise and can have its own parameters. The altitude given by the cpu is compared to
+        the true altitude (altimeter formula on the enclosure pressure) and error statistics are returned per unit.
+        The given objects are not modified (their current state is the initial state of every unit).
+
+    Params :
+        - tg, enclosure, wheastone, gen, ampli, gen_ao : analog chain, as in simulate_analog
+        - sampler : EchantillonneurBloqueur of the chain
+        - can : CanCompare of the chain (its horloge is the clock of the digital stage)
+        - cpu : Cpu of the chain (with its calibration)
+        - n_units : number of simulated sensors
+        - variations : dict {"component.attribute": array of n_units values} with component in
+          "membrane", "R1".."R4" (bridge), "R1_ao".."R4_ao" (amplification), "gen", "gen_ao"
+          ex : {"R1.R": 10e3*(1 + 1e-3*rng.standard_normal(n)), "membrane.epais": ..., "R3.eps": ..., "gen.noise": ...}
+        - seed : seed of the ensemble noise (one stream per noise source)
+        - chunk_size : number of ticks computed at once
+        - warmup_s : ticks before this time are not in the statistics
+          (default : time of the first complete conversion of the CAN)
+
+    Output : dict of arrays of n_units values : "mean_error", "std_error", "rms_error", "max_abs_error" (m)
+    and "count" the number of ticks in the statistics
+
+    Example :
+        n = 500
+        stats = simulation.run_ensemble(tg, TE, wheastone, gen, (R1_ao, R2_ao, R3_ao, R4_ao), gen_ao, EB, can, cpu, n,
+                                        variations={"R1.R": 10e3*(1 + 1e-3*rng.standard_normal(n))}, seed=1)
+        worst = stats["max_abs_error"].max()
+    """
+    variations = {} if variations is None else variations
+    bridge = (wheastone.R1, wheastone.R2, wheastone.R3, wheastone.R4)
+    membranes = _membranes(bridge)
+    components = {"R1": bridge[0], "R2": bridge[1], "R3": bridge[2], "R4": bridge[3],
+                  "R1_ao": ampli[0], "R2_ao": ampli[1], "R3_ao": ampli[2], "R4_ao": ampli[3],
+                  "gen": gen, "gen_ao": gen_ao}
+    if membranes:
+        components["membrane"] = membranes[0]
+
+    sources = list(bridge) + list(ampli) + [gen, gen_ao]
+    streams = {id(c): NoiseStream(s) for c, s in zip(sources, np.random.SeedSequence(seed).spawn(len(sources)))}
+
+    def noise(component, size):
+        return streams[id(component)].draw(n_units*size).reshape(n_units, size)
+
+    sampler = copy.copy(sampler)
+    can = copy.copy(can)
+    edges = can.horloge.edge_indices(tg, initial_value=can.horloge.value)
+    if warmup_s is None:
+        first = max(sampler.multiple - sampler.count - 1, 0) + can.resolution
+        warmup_tick = edges[first] if first < edges.size else tg.size_real
+    else:
+        warmup_tick = int(np.ceil(warmup_s*1000 / tg.real_time_step_ms))
+
+    # current elongation of the membranes, each unit starts with it from its own length
+    dL_start = {id(m): np.ravel(m._L_def)[-1] - np.ravel(m.L)[-1] for m in membranes}
+    stats = column_statistics(np.empty((0, n_units)))
+    with _unit_parameters(components, variations):
+        L_last = {id(m): np.ravel(m.L + dL_start[id(m)]) for m in membranes}
+        for block in tg.blocks(chunk_size):
+            start = block.index[0]
+            P, T = enclosure.get_env(block.exp_index)
+            P = np.broadcast_to(P, (n_units, P.size))
+            T = np.broadcast_to(T, (n_units, T.size))
+            _, _, _, V_gain = _analog_block(P, T, bridge, ampli, gen, gen_ao, membranes, L_last, noise)
+
+            block_edges = edges[(edges >= start) & (edges <= block.index[-1])] - start
+            vb = sampler.hold_batch(V_gain, block_edges)
+            _, out, _ = can.convert_batch(vb, block_edges)
+            _, altitude = cpu.convert(out)
+
+            error = compute_error(altitude, cpu.altitude_from(P[0]))[:, block.index >= warmup_tick]
+            # merged chunk by chunk (Welford / Chan) : no cancellation between the mean and the mean of the squares
+            stats = merge_statistics(stats, column_statistics(error.T))
+
+    count = stats["count"]
+    mean = stats["mean"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = stats["m2"] / count
+    max_abs = np.where(count > 0, np.maximum(np.abs(stats["min"]), np.abs(stats["max"])), 0)
+    return {"mean_error": mean, "std_error": np.sqrt(var), "rms_error": np.sqrt(var + mean**2), "max_abs_error": max_abs,
+            "count": count}
+
+
+def sweep_profiles(tg:TimeGenerator, P, T):
+    """
+    P and T profiles (arrays of tg.size_exp values) visiting every (P, T) couple of the grid, one per experiment step :
+    the pressures are swept at each temperature, and the grid is repeated until the end of the run.
+
+    Example :
+        simu_P, simu_T = simulation.sweep_profiles(tg, np.linspace(2.5e4, 1.1e5, 20), [-20, 20, 60])
+        TE = instruments.TestEnclosure(env, simu_P, simu_T, tg)
+    """
+    P_grid, T_grid = np.meshgrid(np.asarray(P, dtype=float), np.asarray(T, dtype=float))
+    index = np.arange(tg.size_exp) % P_grid.size
+    return P_grid.ravel()[index], T_grid.ravel()[index]
+
+
+def _fit_calibration(value_can, P, T, degree, temperature_degree):
+    """least squares coefficients with the Cpu.coefficient_correction layout (1-D, or 2-D with temperature terms)"""
+    if temperature_degree == 0:
+        return np.polyfit(value_can, P, degree)
+    powers_v = degree - np.arange(degree + 1)
+    powers_T = temperature_degree - np.arange(temperature_degree + 1)
+    A = (value_can[:, None, None]**powers_v[:, None]) * (T[:, None, None]**powers_T)
+    coef, *_ = np.linalg.lstsq(A.reshape(value_can.size, -1), P, rcond=None)
+    return coef.reshape(degree + 1, temperature_degree + 1)
+
+
+def calibrate_cpu(tg:TimeGenerator, enclosure:TestEnclosure, wheastone:montages.Wheastone, gen:Generateur, ampli, gen_ao:Generateur,
+                  sampler:EchantillonneurBloqueur, can:CanCompare, cpu:Cpu, degree=4, temperature_degree=0, install=True, chunk_size=65536) -> Dict[str, np.ndarray]:
+    """
+    Description :
+        Calibration of the cpu from a simulated pressure / temperature sweep (see sweep_profiles) : the whole chain
+        is run in vectorized form (as in simulate_analog and run_ensemble), the CAN outputs are collected and
+        the calibration polynomial giving the pressure from the CAN output is fitted by least squares.
+        One calibration point is kept per experiment step : the last tick of the step where the CAN output is the
+        complete conversion of a sample taken during this step (steps too short for a conversion are skipped).
+        The given sampler and can are not modified, noise is drawn from the components noise streams.
+
+    Params :
+        - tg, enclosure, wheastone, gen, ampli, gen_ao : analog chain, as in simulate_analog
+        - sampler, can, cpu : digital stage, as in run_ensemble
+        - degree : degree of the polynomial in the CAN output
+        - temperature_degree : if > 0, each coefficient is itself a polynomial of the temperature of this degree
+          (2-D coefficients, see Cpu.coefficient_correction)
+        - install : if True, the coefficients are installed with cpu.calibrate
+        - chunk_size : number of ticks computed at once
+
+    Output : dict with "coefficients", the calibration points "value_can", "P", "T", the pressure residuals "residual"
+    (tools.compute_error of the calibrated pressure against the true one), "rms_residual" and "max_abs_residual" (Pa)
+
+    Example :
+        simu_P, simu_T = simulation.sweep_profiles(tg, np.linspace(2.5e4, 1.1e5, 20), [-20, 20, 60])
+        TE = instruments.TestEnclosure(env, simu_P, simu_T, tg)
+        result = simulation.calibrate_cpu(tg, TE, wheastone, gen, (R1_ao, R2_ao, R3_ao, R4_ao), gen_ao, EB, can, cpu, temperature_degree=1)
+        print(result["rms_residual"])
+    """
+    bridge = (wheastone.R1, wheastone.R2, wheastone.R3, wheastone.R4)
+    membranes = _membranes(bridge)
+    L_last = {id(m): np.ravel(m._L_def)[-1] for m in membranes}
+
+    sampler_reference = copy.copy(sampler)
+    sampler_reference.v_bloquee = -1
+    sampler = copy.copy(sampler)
+    can = copy.copy(can)
+    edges = can.horloge.edge_indices(tg, initial_value=can.horloge.value)
+
+    points = np.full((3, tg.size_exp), np.nan)
+    for block in tg.blocks(chunk_size):
+        start = block.index[0]
+        P, T = enclosure.get_env(block.exp_index)
+        _, _, _, V_gain = _analog_block(P, T, bridge, ampli, gen, gen_ao, membranes, L_last)
+
+        block_edges = edges[(edges >= start) & (edges <= block.index[-1])] - start
+        vb = sampler.hold_batch(V_gain, block_edges)
+        _, out, _ = can.convert_batch(vb, block_edges)
+        # conditions of the sample held by the sampler, to pair each CAN output with its true pressure
+        held_exp = sampler_reference.hold_batch(block.exp_index, block_edges)
+
+        valid = (held_exp == block.exp_index) & (out == can.code(vb)*can.quantum)
+        exp_index = block.exp_index[valid]
+        last = np.r_[exp_index[1:] != exp_index[:-1], True] if exp_index.size else np.zeros(0, dtype=bool)
+        points[:, exp_index[last]] = out[valid][last], P[valid][last], T[valid][last]
+
+    value_can, P, T = points[:, ~np.isnan(points[0])]
+    if value_can.size <= degree:
+        raise ValueError(f"{value_can.size} calibration points for a polynomial of degree {degree}, "
+                         "use longer experiment steps or a longer sweep")
+    coefficients = _fit_calibration(value_can, P, T, degree, temperature_degree)
+
+    fitted = copy.copy(cpu)
+    fitted.coefficient_correction = coefficients
+    residual = compute_error(fitted.calibration(value_can, T), P)
+    if install:
+        cpu.calibrate(coefficients)
+    return {"coefficients": coefficients, "value_can": value_can, "P": P, "T": T, "residual": residual,
+            "rms_residual": np.sqrt(np.mean(residual**2)), "max_abs_residual": np.abs(residual).max()}
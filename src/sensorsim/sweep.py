@@ -0,0 +1,97 @@
+"""
+This module provides a parameter sweep engine : a chain is built and run for every point of a parameter grid,
+in parallel worker processes, and the results are gathered in a table (pandas DataFrame).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def grid_shape(grid:Dict[str, Sequence]):
+    return tuple(len(v) for v in grid.values())
+
+
+def grid_point(grid:Dict[str, Sequence], index):
+    """parameters of the point number index of the grid (last parameter varying fastest)"""
+    position = np.unravel_index(index, grid_shape(grid))
+    return {k: v[i] for (k, v), i in zip(grid.items(), position)}
+
+
+def _run_batch(factory, grid, outputs, shm_name, start, stop):
+    """run the points start..stop of the grid and write their results in the shared table"""
+    n_points = int(np.prod(grid_shape(grid)))
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        table = np.ndarray((n_points, len(outputs)), dtype=float, buffer=shm.buf)
+        for index in range(start, stop):
+            result = factory(**grid_point(grid, index))
+            table[index] = [result[k] for k in outputs]
+        del table
+    finally:
+        shm.close()
+    return stop - start
+
+
+def sweep(factory:Callable, grid:Dict[str, Sequence], outputs:List[str], max_workers=None, batch_size=None) -> pd.DataFrame:
+    """
+    Description :
+        Run factory for every point of the cartesian product of grid, over a pool of worker processes.
+        Points are sent to the workers by batches of consecutive indices, and the workers write their numeric
+        results directly in a shared memory table (no pickled result lists).
+
+    Params :
+        - factory : function building and running the chain for one point, called as factory(**point),
+          returning a dict with (at least) the keys of outputs. It has to be defined at module level (picklable).
+        - grid : dict {parameter name: list of values}
+        - outputs : names of the results of factory to keep (numbers)
+        - max_workers : number of worker processes (default : number of cores, 1 : run in this process)
+        - batch_size : number of points per task (default : about 4 tasks per worker)
+
+    Output : DataFrame with one row per point, one column per parameter and per output
+
+    Example :
+        def deflection(P, e, L):
+            tg = instruments.TimeGenerator(1)
+            env = instruments.Environment(tg, P=P)
+            membrane = instruments.Membrane(env, EIgz=1, diameter=L, P_calib=1.1e5, e=e)
+            return {"strain": (membrane.compute_target_def_x()-L)/L}
+
+        table = sweep(deflection, {"P": [.2e5, 1.1e5], "e": [1e-3, 1e-4, 1e-5, 1e-6], "L": 2e-4*np.arange(1, 100)}, ["strain"])
+    """
+    n_points = int(np.prod(grid_shape(grid)))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if batch_size is None:
+        batch_size = max(1, -(-n_points // (4*max_workers)))
+    batches = [(start, min(start + batch_size, n_points)) for start in range(0, n_points, batch_size)]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(n_points*len(outputs), 1)*8)
+    try:
+        table = np.ndarray((n_points, len(outputs)), dtype=float, buffer=shm.buf)
+        table[:] = np.nan
+        if max_workers == 1:
+            for start, stop in batches:
+                _run_batch(factory, grid, outputs, shm.name, start, stop)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(_run_batch, factory, grid, outputs, shm.name, start, stop) for start, stop in batches]
+                for future in futures:
+                    future.result()
+        results = table.copy()
+        del table
+    finally:
+        shm.close()
+        shm.unlink()
+
+    columns = {}
+    position = np.unravel_index(np.arange(n_points), grid_shape(grid))
+    for (k, values), i in zip(grid.items(), position):
+        columns[k] = np.asarray(values)[i]
+    for j, k in enumerate(outputs):
+        columns[k] = results[:, j]
+    return pd.DataFrame(columns)
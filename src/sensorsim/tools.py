@@ -29,30 +29,27 @@ import numpy as np
 
 
 
-def make_calibration_plot(input_var, output_var_calib, output_var_true, error):
+def make_calibration_plot(input_var, output_var_calib, output_var_true, error, webgl_threshold=5000):
     """
     This function compute a graph with :
     - input_var in absciss (Ex : mesurande)
     - output_var_calib: output expermental value of complete sensor (after cpu)
     - output_var_true: "true value" of input
     - error: error between true and experimental output value
+    Above webgl_threshold points, the markers are drawn with WebGL (Scattergl).
 
     Output : fig. It means you have to do f = make_calibration_plot(error) then f.show()
     """
+    scatter = px.Scattergl if webgl_threshold is not None and len(input_var) > webgl_threshold else px.Scatter
     fig1 = make_subplots(specs=[[{"secondary_y": True}]])
-    fig1.add_trace(
-        px.Scatter(x = input_var, y= output_var_calib, mode='markers', name = 'measure'), 
-        secondary_y=False
-        )
-    fig1.add_trace(
-        
-        px.Scatter(x = input_var, y = output_var_true, mode='markers', name = 'true'),
-        secondary_y=False,
-        )
-
-    fig1.add_trace(
-        px.Scatter(x = input_var, y = error, mode='markers', name = 'error'),
-        secondary_y=True
+    fig1.add_traces(
+        [
+            scatter(x = input_var, y= output_var_calib, mode='markers', name = 'measure'),
+            scatter(x = input_var, y = output_var_true, mode='markers', name = 'true'),
+            scatter(x = input_var, y = error, mode='markers', name = 'error'),
+        ],
+        rows=[1, 1, 1], cols=[1, 1, 1],
+        secondary_ys=[False, False, True]
         )
 
     fig1.update_yaxes(title_text="Sortie", secondary_y=False)
@@ -86,6 +83,11 @@ def make_histogram(error):
     return fig
 
 def compute_error(experimental, true_value):
+    """
+    error between experimental and true values : lists give a list, numpy arrays give an array (broadcast)
+    """
+    if isinstance(experimental, np.ndarray) or isinstance(true_value, np.ndarray):
+        return np.subtract(experimental, true_value)
     error = [x-y for x,y in zip(experimental, true_value)]
     return error
 
@@ -93,3 +95,153 @@ def compute_error(experimental, true_value):
 
 
 
+
+
+def lag_filter(x, alpha, y0):
+    """
+    First order recursive filter y[n] = alpha*y[n-1] + (1-alpha)*x[n] along the last axis of x, starting from y0.
+    It is computed in closed form on segments short enough to stay in float range, so there is no loop per sample.
+
+    Params :
+        - x : input signal (array, time on the last axis)
+        - alpha : inertia coefficient (0 : no delay)
+        - y0 : value of y before the first sample (scalar or array matching the leading axes of x)
+    """
+    x = np.asarray(x, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    out = np.empty(np.broadcast_shapes(x.shape, y0.shape + (1,)))
+    n = out.shape[-1]
+    if alpha == 0:
+        out[...] = x
+        return out
+    if abs(alpha) >= 1:
+        m = max(n, 1)
+    else:
+        m = max(1, min(n, int(30 / -np.log10(abs(alpha)))))
+    k = np.arange(m)
+    up = float(alpha) ** -k
+    down = float(alpha) ** k
+    previous = np.broadcast_to(y0, out.shape[:-1])
+    for start in range(0, n, m):
+        seg = x[..., start:start + m]
+        size = seg.shape[-1]
+        acc = np.cumsum(seg * up[:size], axis=-1)
+        out[..., start:start + size] = alpha * down[:size] * previous[..., None] + (1 - alpha) * down[:size] * acc
+        previous = out[..., start + size - 1]
+    return out
+
+
+def _as_series(t, y):
+    t = np.asarray(t)
+    y = np.asarray(y, dtype=float)
+    if t.shape != y.shape:
+        raise ValueError(f"t and y do not have the same shape : {t.shape} and {y.shape}")
+    return t, y
+
+
+#: number of values read at once by the decimations, so a memory-mapped series is never loaded as a whole
+CHUNK_SIZE = 1 << 16
+
+
+def _bins_extrema(values, start):
+    """indices (from start) of the minimum and the maximum of each row of values, NaN ignored"""
+    nan = np.isnan(values)
+    offset = start + np.arange(values.shape[0])*values.shape[1]
+    return (np.where(nan, np.inf, values).argmin(axis=1) + offset,
+            np.where(nan, -np.inf, values).argmax(axis=1) + offset)
+
+
+def decimate_minmax(t, y, max_points):
+    """
+    Min/max envelope decimation : the series is cut in max_points/2 bins and only the minimum and the maximum
+    of each bin are kept (in time order, with the first and last points), so peaks and noise envelope stay visible.
+    NaN (missing values) are ignored. Return (t, y) of at most max_points + 2 points.
+    The bins are read by chunks of about CHUNK_SIZE values (views of y, the last bin may be shorter).
+    """
+    t, y = _as_series(t, y)
+    n = y.size
+    if n <= max_points:
+        return t, y
+    bins = max(max_points // 2, 1)
+    width = -(-n // bins)
+    full = n // width
+    rows = max(CHUNK_SIZE // width, 1)
+    index = [np.array([0, n - 1])]
+    for start in range(0, full, rows):
+        stop = min(start + rows, full)
+        index.extend(_bins_extrema(y[start*width:stop*width].reshape(stop - start, width), start*width))
+    if full*width < n:
+        index.extend(_bins_extrema(y[full*width:].reshape(1, -1), full*width))
+    index = np.unique(np.concatenate(index))
+    return t[index], y[index]
+
+
+def decimate_steps(t, y, max_points):
+    """
+    Transition preserving decimation for step (digital, line shape 'hv') series : only the points where the value
+    changes are kept (with the first and last points), so the step graph is exactly the same.
+    If there are more than max_points transitions, the min/max envelope is used (see decimate_minmax).
+    """
+    t, y = _as_series(t, y)
+    if y.size <= max_points:
+        return t, y
+    index = [np.array([0, y.size - 1])]
+    count = 2
+    for start in range(0, y.size - 1, CHUNK_SIZE):
+        values = y[start:start + CHUNK_SIZE + 1]
+        nan = np.isnan(values)
+        change = (values[1:] != values[:-1]) & ~(nan[1:] & nan[:-1])
+        index.append(np.flatnonzero(change) + start + 1)
+        count += index[-1].size
+        if count > max_points:
+            return decimate_minmax(t, y, max_points)
+    index = np.unique(np.concatenate(index))
+    return t[index], y[index]
+
+
+def lttb(t, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets decimation (S. Steinarsson, 2013) : one point per bucket, the one making the
+    largest triangle with the point kept in the previous bucket and the mean of the next bucket.
+    It keeps the visual shape of the series with max_points points. t has to be numeric, y without NaN.
+    """
+    t, y = _as_series(t, y)
+    n = y.size
+    if n <= max_points or max_points < 3:
+        return t, y
+    x = np.asarray(t, dtype=float)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    index = np.empty(max_points, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+    previous = 0
+    for b in range(max_points - 2):
+        start, stop = edges[b], edges[b + 1]
+        next_stop = edges[b + 2] if b + 2 < edges.size else n
+        if b + 2 < edges.size:
+            x_next, y_next = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        else:
+            x_next, y_next = x[-1], y[-1]
+        area = np.abs((x[previous] - x_next)*(y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop])*(y_next - y[previous]))
+        previous = start + int(area.argmax())
+        index[b + 1] = previous
+    return t[index], y[index]
+
+
+def decimate(t, y, max_points, method="minmax", step=False):
+    """
+    Decimate a series for plotting (see decimate_minmax, decimate_steps and lttb).
+
+    Params :
+        - t, y : series to decimate
+        - max_points : target number of points (ex : width of the graph in pixels x points per pixel)
+        - method : "minmax" (envelope) or "lttb" for analog series
+        - step : True for step series (line shape 'hv'), decimated with decimate_steps whatever the method
+    """
+    if step:
+        return decimate_steps(t, y, max_points)
+    if method == "minmax":
+        return decimate_minmax(t, y, max_points)
+    if method == "lttb":
+        return lttb(t, y, max_points)
+    raise ValueError(f"unknown decimation method {method}, expected 'minmax' or 'lttb'")
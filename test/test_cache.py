@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+
+from sensorsim import instruments
+from sensorsim.cache import ResultCache, config_hash
+
+
+def make_chain(R=10e3, seed=1):
+    tg = instruments.TimeGenerator(2, 500, 10)
+    env = instruments.Environment(tg, seed=seed)
+    TE = instruments.TestEnclosure(env, np.linspace(1e5, 3e4, tg.size_exp), np.full(tg.size_exp, 20.), tg)
+    membrane = instruments.Membrane(env, EIgz=1, diameter=2.8e-3, P_calib=1.2e5)
+    R1 = instruments.Resistance(env, R=R)
+    R1.attach_membrane(membrane, 1)
+    return tg, TE, R1
+
+
+@pytest.mark.unit_test
+def test_config_hash():
+    key = config_hash(*make_chain())
+    assert key == config_hash(*make_chain())
+    assert key != config_hash(*make_chain(R=11e3))
+    assert key != config_hash(*make_chain(seed=2))
+    assert key != config_hash(*make_chain(), chunk_size=10)
+
+    # the noise already drawn and not consumed is part of the state
+    keys = set()
+    tg, TE, R1 = make_chain()
+    for _ in range(3):
+        keys.add(config_hash(R1))
+        R1.noise_stream()
+    assert len(keys) == 3
+    _, _, other = make_chain()
+    other.noise_stream.draw(3)
+    assert config_hash(other) == config_hash(R1)
+
+    # functions are described by their code and the values of their closure
+    scale = 2
+    assert config_hash(lambda x: x) != config_hash(lambda y: 2*y)
+    assert config_hash(lambda x: x) == config_hash(lambda x: x)
+    assert config_hash(lambda x: scale*x) != config_hash(lambda x: 3*x)
+    first = config_hash(lambda x: scale*x)
+    scale = 3
+    assert config_hash(lambda x: scale*x) != first
+    assert config_hash(np.sin) != config_hash(np.cos)
+    with pytest.raises(TypeError):
+        config_hash(object())
+
+    tg, TE, R1 = make_chain()
+    TE.P = TE.P.copy()
+    TE.P[3] += 1
+    assert key != config_hash(tg, TE, R1)
+
+
+@pytest.mark.unit_test
+def test_result_cache(tmp_path):
+    results = ResultCache(tmp_path, max_entries=2)
+    calls = []
+
+    def run():
+        calls.append(1)
+        return {"time": np.arange(5), "V": np.linspace(0, 1, 5)}
+
+    first = results.cached("a", run)
+    again = results.cached("a", run)
+    assert len(calls) == 1
+    assert np.array_equal(first["V"], again["V"]) and again["time"].dtype == first["time"].dtype
+
+    results.put("b", {"V": np.zeros(3)})
+    os.utime(results.path("a"), ns=(1, 1))
+    os.utime(results.path("b"), ns=(2, 2))
+    assert results.get("a") is not None  # a is now the most recently used
+    results.put("c", {"V": np.ones(3)})
+    assert "a" in results and "c" in results and "b" not in results
+
+    results.max_bytes = os.path.getsize(results.path("c"))
+    results.evict()
+    assert [os.path.basename(e[0]) for e in results.entries()] == ["c.npz"]
+    results.clear()
+    assert results.get("c") is None
@@ -1,7 +1,7 @@
 import numpy as np
 import pytest
 
-from sensorsim.instruments import CanCompare, EchantillonneurBloqueur, Environment, Horloge, Recorder, TestEnclosure, TimeGenerator
+from sensorsim.instruments import CanCompare, Cpu, EchantillonneurBloqueur, Environment, Horloge, Membrane, Recorder, Resistance, TestEnclosure, TimeGenerator, make_plot
 
 b = 1
 
@@ -16,6 +16,24 @@ def test_time_generator():
 
     assert tg.get_time_second == 7
 
+@pytest.mark.unit_test
+def test_time_generator_experiment_ticks():
+    tg = TimeGenerator(3, 500, 10)
+    assert tg.size_real == 301
+    assert tg.size_exp == 7
+
+    exp_times = []
+    exp_index = []
+    for tt in tg:
+        if tg.is_exp_time:
+            exp_times.append(tt)
+            exp_index.append(tg.current_time_exp_index)
+    assert exp_times == list(tg.t_experiment)
+    assert exp_index == list(range(tg.size_exp))
+
+    tg.experiment_step_ms = 1000
+    assert tg.size_exp == 4
+
 @pytest.mark.unit_test
 def test_enclosure():
 
@@ -39,6 +57,262 @@ def test_enclosure():
         old_P = E.P
     
  
+@pytest.mark.unit_test
+def test_enclosure_streaming():
+    tg = TimeGenerator(5, 1000, 10, streaming=True)
+    simu_P = np.linspace(1e5, 1e6 , tg.size_exp)
+    simu_T = np.ones(tg.size_exp)*20
+
+    E = Environment(tg)
+    TE = TestEnclosure(E, simu_P, simu_T, tg)
+    for tt in tg:
+        pass
+    assert tt == 5000
+    assert E.P == simu_P[-1]
+    assert tg._timelines == {}
+
+def make_analog_chain(tg):
+    simu_P = np.linspace(101325.0, 26442.2, tg.size_exp)
+    simu_T = np.linspace(20, 30, tg.size_exp)
+    E = Environment(tg)
+    TE = TestEnclosure(E, simu_P, simu_T, tg)
+    L = 2.8e-3
+    e = 1e-5
+    membrane = Membrane(E, EIgz=130e9*e*L/12*(e**2+L**2), e=e, diameter=L, P_calib=1.2e5)
+    R = Resistance(E, R=1e3, K=3.2)
+    R.attach_membrane(membrane, 1)
+    R.eps = 0
+    return E, membrane, R
+
+@pytest.mark.unit_test
+def test_block_iteration():
+    tg = TimeGenerator(3, 500, 10)
+    E, membrane, R = make_analog_chain(tg)
+    L_def = []
+    res = []
+    for tt in tg:
+        L_def.append(membrane.L_def)
+        res.append(R())
+
+    tg_b = TimeGenerator(3, 500, 10)
+    E_b, membrane_b, R_b = make_analog_chain(tg_b)
+    times, L_def_b, res_b = [], [], []
+    for block in tg_b.iter_blocks(64):
+        assert np.array_equal(E_b.time, block.time)
+        times.append(block.time)
+        L_def_b.append(membrane_b.L_def)
+        res_b.append(R_b())
+
+    assert np.array_equal(np.concatenate(times), tg.t_real)
+    assert np.allclose(np.concatenate(L_def_b), L_def, rtol=1e-12)
+    assert np.allclose(np.concatenate(res_b), res, rtol=1e-12)
+    assert tg_b.current_time_exp_index == tg.size_exp - 1
+
+@pytest.mark.unit_test
+def test_block_iteration_needs_opt_in():
+    tg = TimeGenerator(1, 500, 10)
+    E = Environment(tg)
+    Horloge(E, 10)
+    with pytest.raises(TypeError):
+        next(tg.iter_blocks())
+
+def run_digital_chain(tg, events):
+    E, membrane, R = make_analog_chain(tg)
+    h = Horloge(E, 5, 1000)
+    EB = EchantillonneurBloqueur(h, 2)
+    CAN = CanCompare(h, 8, 5)
+    r = Recorder(E)
+    r.config_name({"M": "membrane", "hh": "horloge", "cout": "can output"})
+    for tt in (tg.iter_events() if events else tg):
+        CAN(EB(E.P/1e5))
+        r.snapshot({"M": membrane.L_def, "hh": h.value, "cout": CAN.out})
+    return r
+
+@pytest.mark.unit_test
+def test_event_iteration():
+    tg = TimeGenerator(4, 500, 10)
+    r = run_digital_chain(tg, events=False)
+
+    tg_e = TimeGenerator(4, 500, 10)
+    r_e = run_digital_chain(tg_e, events=True)
+    assert len(r_e.snap_time) < len(r.snap_time)
+    assert r_e.snap_time[-1] == r.snap_time[-1]
+
+    held = r_e.hold(tg.t_real)
+    assert np.array_equal(held["hh"], r.recordings["hh"])
+    assert np.array_equal(held["cout"], r.recordings["cout"])
+    assert np.allclose(held["M"], r.recordings["M"], rtol=1e-10)
+
+@pytest.mark.unit_test
+def test_compiled_schedule():
+    tg = TimeGenerator(2, 500, 10)
+    E = Environment(tg)
+    L = 2.8e-3
+    membrane = Membrane(E, EIgz=1, e=1e-5, diameter=L, P_calib=1.2e5)
+    R = Resistance(E, R=1e3, K=3.2)
+    R.attach_membrane(membrane, 1)
+    # built after the membrane : the cascade would update the membrane with the previous pressure
+    TE = TestEnclosure(E, np.linspace(1e5, 2e5, tg.size_exp), np.ones(tg.size_exp)*20, tg)
+
+    order = tg.compile()
+    assert order.index(TE) < order.index(membrane) < order.index(R)
+    assert len(order) == 4
+
+    calls = []
+    compute_R = R.compute_R
+    R.compute_R = lambda: calls.append(1) or compute_R()
+    for tt in tg:
+        assert membrane._target_L_def == membrane.compute_target_def_x()
+    assert len(calls) == tg.size_real
+
+    tg.reset_schedule()
+    for tt in tg:
+        pass
+    assert len(calls) == 3 * tg.size_real
+
+@pytest.mark.unit_test
+def test_lazy_evaluation():
+    tg = TimeGenerator(3, 500, 10)
+    E, membrane, R = make_analog_chain(tg)
+    expected = [R() for tt in tg]
+
+    tg_l = TimeGenerator(3, 500, 10)
+    E_l, membrane_l, R_l = make_analog_chain(tg_l)
+    membrane_l.lazy = True
+    R_l.lazy = True
+    R_unread = Resistance(E_l, R=1e3, lazy=True)
+    calls = []
+    R_unread.compute_R = lambda: calls.append(1)
+
+    values = [R_l() for tt in tg_l]
+    assert np.allclose(values, expected, rtol=1e-12)
+    assert calls == []
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("every", [7, 60, 120])
+def test_lazy_sparse_reads(every):
+    tg = TimeGenerator(6, 500, 10)
+    E, membrane, R = make_analog_chain(tg)
+    expected = [membrane.L_def for tt in tg]
+
+    tg_l = TimeGenerator(6, 500, 10)
+    E_l, membrane_l, R_l = make_analog_chain(tg_l)
+    membrane_l.lazy = True
+    R_l.lazy = True  # an eager resistance would read the membrane at every tick
+    for i, tt in enumerate(tg_l):
+        if i % every == 0 or i == tg_l.size_real - 1:
+            # the reads cross experiment steps (every 50 ticks), where P and T change
+            assert membrane_l.L_def == pytest.approx(expected[i], rel=1e-13)
+            assert membrane_l.dL == pytest.approx(expected[i] - membrane.L, rel=1e-6)
+
+@pytest.mark.unit_test
+def test_memoized_deterministic_terms():
+    tg = TimeGenerator(2, 500, 10)
+    E, membrane, R = make_analog_chain(tg)
+    targets = []
+    membrane.compute_target_def_x = lambda f=membrane.compute_target_def_x: targets.append(1) or f()
+    R.eps = 1e-3
+    values = []
+    for tt in tg:
+        values.append(R())
+    assert len(targets) == tg.size_exp
+    # noise is still drawn at each update
+    assert len(set(values)) == len(values)
+
+    membrane.epais = 2e-5
+    membrane.update(E)
+    assert len(targets) == tg.size_exp + 1
+
+@pytest.mark.unit_test
+def test_can_convert_batch():
+    tg = TimeGenerator(6, 1000, 10)
+    E = Environment(tg)
+    h = Horloge(E, 10, 1000)
+    EB = EchantillonneurBloqueur(h, 6)
+    CAN = CanCompare(h, 4, 5)
+    vb, edges, qs, out, internal = [], [], [], [], []
+    previous = False
+    for tt in tg:
+        v = EB(2.5 + 2*np.sin(tt/700))
+        v = np.nan if 2000 <= tt < 2600 else v  # missing input : no bit is set, as every comparison is false
+        CAN(v)
+        if h.value and not previous:
+            edges.append(tg.current_time_index - 1)
+        previous = h.value
+        vb.append(v)
+        qs.append(CAN.qs)
+        out.append(CAN.out)
+        internal.append(CAN.internal)
+
+    can_b = CanCompare(h, 4, 5)
+    half = len(vb) // 2
+    edges = np.array(edges)
+    assert np.array_equal(Horloge(E, 10, 1000).edge_indices(tg), edges)
+    first = can_b.convert_batch(vb[:half], edges[edges < half])
+    second = can_b.convert_batch(vb[half:], edges[edges >= half] - half)
+    for expected, a, b in zip((qs, out, internal), first, second):
+        assert np.array_equal(np.concatenate((a, b)), expected)
+    assert (can_b.qs, can_b.nb, can_b.v) == (CAN.qs, CAN.nb, CAN.v)
+    assert len(set(out)) > 3
+    assert np.array_equal(CAN.code([np.nan, 0., 2.5, np.inf]), [0, 0, 7, 15])
+
+    units = CanCompare(h, 4, 5)
+    qs_units, _, _ = units.convert_batch(np.vstack((vb, np.ones(len(vb)))), edges)
+    assert np.array_equal(qs_units[0], qs)
+    assert qs_units.shape == (2, len(vb))
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("multiple", [0, 1, 4])
+def test_clock_schedule_and_hold_batch(multiple):
+    tg = TimeGenerator(5, 1000, 1)
+    E = Environment(tg)
+    h = Horloge(E, 3, 1000)
+    EB = EchantillonneurBloqueur(h, multiple)
+    pulses, held = [], []
+    value = h.value
+    for tt in tg:
+        if h.value != value:
+            pulses.append(tg.current_time_index - 1)
+        value = h.value
+        held.append(EB(np.cos(tt/300)))
+    assert len(pulses) == 5 * 2 * 3 + 1
+    assert np.array_equal(h.pulse_indices(tg), pulses)
+    assert np.array_equal(h.pulse_indices(tg, 1000, 3000), [p for p in pulses if 1000 <= p < 3000])
+
+    edges = Horloge(E, 3, 1000).edge_indices(tg)
+    signal = np.cos(tg.t_real/300)
+    EB_b = EchantillonneurBloqueur(h, multiple)
+    first = EB_b.hold_batch(signal[:2500], edges[edges < 2500])
+    second = EB_b.hold_batch(signal[2500:], edges[edges >= 2500] - 2500)
+    assert np.array_equal(np.concatenate((first, second)), held)
+    assert (EB_b.count, EB_b.v_bloquee) == (EB.count, EB.v_bloquee)
+
+    units = EchantillonneurBloqueur(h, multiple).hold_batch(np.vstack((signal, 2*signal)), edges)
+    assert np.array_equal(units[1], 2*np.array(held))
+
+@pytest.mark.unit_test
+def test_cpu_batch():
+    tg = TimeGenerator(1, 1000, 10)
+    E = Environment(tg)
+    cpu = Cpu(E, Horloge(E, 10))
+    values = np.linspace(0.5, 4.5, 1001)
+
+    coef = cpu.coefficient_correction
+    expected = sum(values**(len(coef)-i-1) * coef[i] for i in range(len(coef)))
+    pression, altitude = cpu.convert(values)
+    assert np.allclose(pression, expected, rtol=1e-12)
+    assert np.allclose(pression, np.polyval(coef, values), rtol=1e-12)
+    assert cpu(values[10]) == pytest.approx(altitude[10], rel=1e-12)
+
+    cpu.calibrate(3)
+    assert cpu.coefficient_correction == 3
+    assert np.array_equal(cpu.convert(values)[0], np.full(values.shape, 3.))
+    cpu.calibrate([2, 1])
+    assert cpu.coefficient_correction == [2, 1]
+    assert np.array_equal(cpu.convert(values)[0], 2*values + 1)
+    cpu.calibrate(None)
+    assert np.array_equal(cpu.convert(values)[0], values)
+
 @pytest.mark.unit_test
 def test_recorders():
 
@@ -110,4 +384,165 @@ def test_can_with_numeric_stack():
     for tt in tg:
         
         CAN(4.5)
-        print(E.time, h.value, CAN.internal, CAN.out)
\ No newline at end of file
+        print(E.time, h.value, CAN.internal, CAN.out)
+
+
+@pytest.mark.unit_test
+def test_columnar_recorder():
+    records = {}
+    for storage in ("list", "columnar"):
+        tg = TimeGenerator(2, 500, 10)
+        E, membrane, R = make_analog_chain(tg)
+        r = Recorder(E, storage=storage, capacity=None if storage == "list" else 16)
+        r.config_name({"M": "membrane", "R": "resistance"})
+        for tt in tg:
+            d = {"M": membrane.L_def}
+            if tt % 100 == 0:
+                d["R"] = R.resistance
+            r.snapshot(d)
+        records[storage] = r
+
+    r = records["columnar"]
+    assert isinstance(r.recordings["M"], np.ndarray) and r.recordings["M"].base is r._store.data
+    assert r._store.capacity == 256
+    assert np.array_equal(r.snap_time, records["list"].snap_time)
+    assert np.array_equal(r.recordings["M"], records["list"].recordings["M"])
+    expected_R = np.array(records["list"].recordings["R"], dtype=float)
+    assert np.array_equal(np.isnan(r.recordings["R"]), np.isnan(expected_R))
+    assert np.array_equal(r.recordings["R"], expected_R, equal_nan=True)
+
+    assert np.array_equal(r.hold(tg.t_real)["M"], records["list"].recordings["M"])
+    r.config_name({"late": "added after the start"})
+    r.snapshot({"late": "not a number"})
+    assert np.isnan(r.recordings["late"]).all() and len(r.recordings["late"]) == tg.size_real + 1
+    r.reset()
+    assert r.recordings == {} and len(r.snap_time) == 0
+
+    # a streamed run is not preallocated for its whole duration
+    tg = TimeGenerator(60, 500, 10, streaming=True)
+    E = Environment(tg)
+    r = Recorder(E, storage="columnar")
+    assert r._store.capacity == 1024
+    r.config_name({"t": "time"})
+    for tt in tg:
+        r.snapshot({"t": E.time})
+    assert len(r.recordings["t"]) == tg.size_real and r._store.capacity == 8192
+
+@pytest.mark.unit_test
+def test_recorder_probes():
+    for storage in ("list", "columnar"):
+        tg = TimeGenerator(2, 500, 10)
+        E, membrane, R = make_analog_chain(tg)
+        r = Recorder(E, storage=storage)
+        r.config_name({"P": "pressure"})
+        r.probe("M", membrane, "L_def", "membrane")
+        r.probe("R", R, type_plot=False)
+        expected = {"M": [], "R": []}
+        for tt in tg:
+            r.sample()
+            expected["M"].append(membrane.L_def)
+            expected["R"].append(R.resistance)
+        assert r.name_recordings == {"P": "pressure", "M": "membrane", "R": "R"}
+        assert r.type_plot["R"] is False
+        assert np.array_equal(r.snap_time, tg.t_real)
+        assert np.array_equal(r.recordings["M"], expected["M"])
+        assert np.array_equal(r.recordings["R"], expected["R"])
+        assert np.array_equal(np.asarray(r.recordings["P"], dtype=float), np.full(tg.size_real, np.nan), equal_nan=True)
+
+    # attributes are read with getattr : keywords and dotted paths are valid names
+    r = Recorder(E)
+    setattr(membrane, "lambda", 3.)
+    r.probe("kw", membrane, "lambda")
+    r.probe("tmax", E, "tg.tmax_second")
+    r.sample()
+    assert r.recordings == {"kw": [3.], "tmax": [2]}
+
+@pytest.mark.unit_test
+def test_ring_recorder():
+    tg = TimeGenerator(10, 500, 10)
+    E, membrane, R = make_analog_chain(tg)
+    full = Recorder(E, storage="columnar")
+    ring = Recorder(E, storage="ring", capacity=150)
+    ring._store.chunk_size = 64
+    for r in (full, ring):
+        r.probe("M", membrane, "L_def")
+        r.probe("R", lambda: R.resistance if E.time % 50 == 0 else None)
+    for tt in tg:
+        full.sample()
+        ring.sample()
+        if tt == 500:
+            assert np.array_equal(ring.snap_time, full.snap_time)
+
+    assert len(ring.snap_time) == 150 and ring._store.data.shape == (2, 150)
+    assert np.array_equal(ring.snap_time, full.snap_time[-150:])
+    assert np.array_equal(ring.recordings["M"], full.recordings["M"][-150:])
+
+    stats = ring.statistics()
+    expected = full.statistics()
+    R_values = full.recordings["R"][~np.isnan(full.recordings["R"])]
+    assert stats["R"]["count"] == expected["R"]["count"] == R_values.size
+    for k, values in (("M", full.recordings["M"]), ("R", R_values)):
+        assert stats[k]["min"] == values.min() and stats[k]["max"] == values.max()
+        assert np.isclose(stats[k]["mean"], values.mean(), rtol=1e-12)
+        assert np.isclose(stats[k]["var"], values.var(), rtol=1e-6)
+        assert np.isclose(expected[k]["var"], values.var(), rtol=1e-6)
+
+    # list storage : missing values are ignored, recordings of arrays or of ragged values are skipped
+    r = Recorder(E)
+    r.config_name({"x": "x", "group": "group", "ragged": "ragged"})
+    r.snapshot({"x": 1., "group": np.array([1., 2.]), "ragged": [1.]})
+    r.snapshot({"group": np.array([3., 4.]), "ragged": [1., 2.]})
+    r.snapshot({"x": 3.})
+    stats = r.statistics()
+    assert list(stats) == ["x"]
+    assert stats["x"]["count"] == 2 and stats["x"]["mean"] == 2. and stats["x"]["var"] == 1.
+
+@pytest.mark.unit_test
+def test_make_plot_decimation():
+    t = np.arange(200_000) / 100
+    analog = np.sin(t)
+    digital = (t // 10) % 2
+    fig = make_plot(t, [analog, [digital, analog]], titles=("a", ("d", "a")), graph_type=[False, [True, False]],
+                                width=500, points_per_pixel=2)
+    sizes = [len(trace.x) for trace in fig.data]
+    assert sizes[0] <= 1002 and sizes[1] == 201 and sizes[2] <= 1002
+    fig = make_plot(t[:100], [analog[:100]], titles=("a",), graph_type=[False], points_per_pixel=2)
+    assert len(fig.data[0].x) == 100
+
+@pytest.mark.unit_test
+def test_make_plot_webgl():
+    t = np.arange(20_000) / 100
+    fig = make_plot(t, [np.sin(t), [np.cos(t)[:100], (t[:100] > .5)]], titles=("sin", ("cos", "step")))
+    assert [trace.type for trace in fig.data] == ["scattergl", "scatter", "scatter"]
+    assert [trace.line.shape for trace in fig.data] == ["linear", "spline", "spline"]
+    assert fig.data[1].xaxis == "x2"
+    fig = make_plot(t, [np.sin(t)], titles=("sin",), graph_type=[True], webgl_threshold=None)
+    assert fig.data[0].type == "scatter" and fig.data[0].line.shape == "hv"
+
+@pytest.mark.unit_test
+def test_make_plot_groups():
+    t = np.arange(100) / 100
+    fig = make_plot(t, [np.sin(t), np.stack((np.sin(t), np.cos(t))), [list(t), list(t)], list(t)],
+                    titles=("sin", ("sin", "cos"), ("a", "b"), "list"))
+    assert [trace.name for trace in fig.data] == ["sin", "sin", "cos", "a", "b", "list"]
+    assert [trace.xaxis for trace in fig.data] == ["x", "x2", "x2", "x3", "x3", "x4"]
+    assert np.array_equal(fig.data[2].y, np.cos(t))
+
+@pytest.mark.unit_test
+def test_recorder_to_dataframe():
+    frames = {}
+    for storage in ("list", "columnar"):
+        tg = TimeGenerator(2, 500, 10)
+        E, membrane, R = make_analog_chain(tg)
+        r = Recorder(E, storage=storage)
+        r.probe("M", membrane, "L_def", "membrane")
+        r.probe("R", lambda: R.resistance if E.time % 100 == 0 else None, name="resistance")
+        for tt in tg:
+            r.sample()
+        frames[storage] = df = r.to_dataframe()
+        assert list(df.columns) == ["membrane", "resistance"]
+        assert df.index.name == "snap_time" and np.array_equal(df.index, tg.t_real)
+        assert df["resistance"].isna().sum() == tg.size_real - 21
+
+    assert np.shares_memory(frames["columnar"]["membrane"].to_numpy(), r._store.data)
+    assert frames["columnar"].equals(frames["list"])
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+import pytest
+
+from sensorsim.instruments import Environment, Horloge, Recorder, TimeGenerator
+from sensorsim.live import LiveMonitor
+
+
+class Collect:
+    def __init__(self):
+        self.increments = []
+
+    def __call__(self, increment):
+        self.increments.append(increment)
+
+    def series(self, key):
+        return (np.concatenate([i[key][0] for i in self.increments]), np.concatenate([i[key][1] for i in self.increments]))
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("storage", ["list", "columnar", "ring"])
+def test_live_monitor(storage):
+    tg = TimeGenerator(20, 1000, 10)
+    E = Environment(tg)
+    h = Horloge(E, 2, 1000)
+    r = Recorder(E, storage=storage, capacity=None if storage != "ring" else 1000)
+    if r._store is not None:
+        r._store.chunk_size = 50
+    r.probe("hh", h, "value", type_plot=True)
+    r.probe("x", lambda: E.time/1000)
+
+    sink = Collect()
+    with LiveMonitor(r, [sink], interval=0.001, points_per_update=10_000) as monitor:
+        for tt in tg:
+            r.sample()
+            if tt % 1000 == 0:
+                time.sleep(0.002)
+    assert monitor.position == tg.size_real
+    assert len(sink.increments) > 1
+
+    t, x = sink.series("x")
+    assert np.array_equal(t, tg.t_real/1000) and np.array_equal(x, t)
+    t, hh = sink.series("hh")
+    assert t.size == tg.size_real
+    window = len(r.snap_time)
+    assert np.array_equal(hh[-window:], np.asarray(r.recordings["hh"], dtype=float))
+
+
+@pytest.mark.unit_test
+def test_live_monitor_decimation():
+    tg = TimeGenerator(100, 1000, 10)
+    E = Environment(tg)
+    r = Recorder(E, storage="columnar")
+    r.probe("x", lambda: np.sin(E.time/1000))
+    for tt in tg:
+        r.sample()
+    sink = Collect()
+    monitor = LiveMonitor(r, [sink], points_per_update=200)
+    monitor.stop()
+    assert len(sink.increments) == 1 and sink.series("x")[0].size <= 202
+    assert monitor.poll() == 0
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from sensorsim import instruments, montages
+
+
+@pytest.mark.unit_test
+def test_wheastone_broadcasting():
+    V_0 = np.linspace(4.9, 5.1, 50)
+    R = np.array([10e3, 17.9e3, 1e3, 1.79e3])
+    candidates = R * (1 + np.random.default_rng(0).uniform(-0.01, 0.01, (200, 4)))
+
+    w = montages.Wheastone(*(candidates[:, i:i+1] for i in range(4)))
+    out = w(V_0)
+    assert out.shape == (200, 50)
+    assert out[3, 7] == pytest.approx(montages.wheastone_bridge(V_0[7], *candidates[3]), rel=1e-12)
+
+    assert montages.wheastone_bridge([5, 5], *R) == pytest.approx(np.full(2, montages.wheastone_bridge(5, *R)))
+
+
+@pytest.mark.unit_test
+def test_montages_with_objects():
+    tg = instruments.TimeGenerator(1)
+    env = instruments.Environment(tg)
+    gen = instruments.Generateur(5, noise=0)
+    R = [instruments.Resistance(env, R=r) for r in (2.7e3, 92e3, 10, 100e3)]
+    w = montages.Wheastone(*R)
+    assert w(gen) == montages.wheastone_bridge(5, 2.7e3, 92e3, 10, 100e3)
+
+    V2 = np.linspace(0, 1e-3, 10)
+    out = montages.montage_ampli_op(gen, V2, *R)
+    assert out.shape == (10,)
+    assert out[4] == pytest.approx(montages.montage_ampli_op(5, V2[4], 2.7e3, 92e3, 10, 100e3))
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from sensorsim.instruments import Environment, Horloge, Recorder, TimeGenerator
+from sensorsim.runfile import RunFile, RunWriter
+
+
+def record(tg, storage, path, capacity=None):
+    E = Environment(tg)
+    h = Horloge(E, 2, 1000)
+    r = Recorder(E, "run", storage=storage, capacity=capacity)
+    r._store.chunk_size = 64
+    r.probe("hh", h, "value", "horloge", type_plot=True)
+    r.probe("x", lambda: np.sin(E.time/1000), name="sinus", type_plot=False)
+    r.config_name({"empty": "never recorded"})
+    for tt in tg:
+        r.sample()
+        if tt == 100:
+            r.stream_to(path)
+    r.close_stream()
+    return r
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("storage", ["columnar", "ring"])
+def test_stream_and_open(tmp_path, storage):
+    tg = TimeGenerator(10, 1000, 10)
+    r = record(tg, storage, tmp_path / "run", capacity=None if storage == "columnar" else 300)
+
+    opened = Recorder.open(tmp_path / "run")
+    assert isinstance(opened.snap_time, np.memmap)
+    assert np.array_equal(opened.snap_time, tg.t_real)
+    assert opened.name_recordings == {"hh": "horloge", "x": "sinus", "empty": "never recorded"}
+    assert opened.type_plot["hh"] is True and opened.title_graph == "run"
+    assert np.isnan(opened.recordings["empty"]).all()
+    window = len(r.snap_time)
+    assert np.array_equal(opened.recordings["x"][-window:], r.recordings["x"])
+    assert np.array_equal(opened.hold(tg.t_real)["hh"], opened.recordings["hh"])
+    assert opened.statistics()["hh"]["count"] == tg.size_real
+    opened.statistics_chunk = 70
+    stats = opened.statistics()
+    x = np.asarray(opened.recordings["x"])
+    assert stats["x"]["count"] == x.size and stats["x"]["max"] == x.max()
+    assert np.isclose(stats["x"]["mean"], x.mean()) and np.isclose(stats["x"]["var"], x.var())
+    assert stats["empty"]["count"] == 0 and np.isnan(stats["empty"]["min"])
+    header = RunFile(tmp_path / "run").header
+    assert header["timebase"] == {"tmax_second": 10, "experiment_step_ms": 1000, "real_time_step_ms": 10}
+
+
+@pytest.mark.unit_test
+def test_run_writer(tmp_path):
+    with RunWriter(tmp_path / "run", ["a", "b"]) as writer:
+        writer.write(np.arange(3), {"a": [1, 2, 3]})
+        partial = RunFile(tmp_path / "run")
+        assert partial.size == 3 and np.isnan(partial.columns()["b"]).all()
+        writer.write(np.arange(3, 5), {"a": [4, 5], "b": [0, 0]})
+        with pytest.raises(ValueError):
+            writer.write(np.arange(2), {"a": [1]})
+    run = RunFile(tmp_path / "run")
+    assert np.array_equal(run.columns()["a"], [1, 2, 3, 4, 5])
+    assert np.array_equal(run.times(), np.arange(5))
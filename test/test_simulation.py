@@ -0,0 +1,198 @@
+import numpy as np
+import pytest
+
+from sensorsim import instruments, montages, simulation
+
+
+def build_chain(tg, noise=1e-6, quality="high", seed=None):
+    simu_P = np.linspace(101325.0,26442.18910734488 , tg.size_exp)
+    simu_T = np.linspace(20, 25, tg.size_exp)
+    env = instruments.Environment(tg, seed=seed)
+    TE = instruments.TestEnclosure(env, simu_P, simu_T, tg)
+
+    L= 2.8e-3
+    e= 1e-5
+    Igz = e*L/12*(e**2+L**2)
+    membrane = instruments.Membrane(E = env, EIgz=130e9*Igz, e=e , diameter= L, P_calib = 1.2e5)
+
+    gen = instruments.Generateur(v_alim=5.0,noise=noise, E=env)
+    R1 = instruments.Resistance(E=env, R=10e3, quality=quality)
+    R2 = instruments.Resistance(E=env, R=17.9e3, quality=quality)
+    R3 = instruments.Resistance(E=env, R=1e3,K=3.2, quality=quality)
+    R4 = instruments.Resistance(E=env, R=1.79e3,K=3.2, quality=quality)
+    R4.attach_membrane(membrane,-1)
+    R3.attach_membrane(membrane,1)
+    wheastone = montages.Wheastone(R1, R2, R3, R4)
+
+    ampli = (
+        instruments.Resistance(E=env, R=2.7e3, quality=quality),
+        instruments.Resistance(E=env, R=92e3, quality=quality),
+        instruments.Resistance(E=env, R=10, quality=quality),
+        instruments.Resistance(E=env, R=100e3, quality=quality),
+    )
+    gen_ao = instruments.Generateur(v_alim=89/250, noise=noise, E=env)
+    return {"env": env, "TE": TE, "membrane": membrane, "wheastone": wheastone, "gen": gen, "ampli": ampli, "gen_ao": gen_ao}
+
+
+def run_loop(tg, c):
+    out = {"L_def": [], "V_mesure": [], "V_gain": []}
+    for tt in tg:
+        V_mesure = c["wheastone"](c["gen"]())
+        V_gain = montages.montage_ampli_op(c["gen_ao"](), V_mesure, *[r() for r in c["ampli"]])
+        out["L_def"].append(c["membrane"].L_def)
+        out["V_mesure"].append(V_mesure)
+        out["V_gain"].append(V_gain)
+    return out
+
+
+@pytest.mark.unit_test
+def test_simulate_analog_matches_loop():
+    tg = instruments.TimeGenerator(6, 500, 10)
+    c = build_chain(tg, noise=0)
+    for r in (c["wheastone"].R1, c["wheastone"].R2, c["wheastone"].R3, c["wheastone"].R4) + c["ampli"]:
+        r.eps = 0
+    expected = run_loop(tg, c)
+
+    tg = instruments.TimeGenerator(6, 500, 10)
+    c = build_chain(tg, noise=0)
+    for r in (c["wheastone"].R1, c["wheastone"].R2, c["wheastone"].R3, c["wheastone"].R4) + c["ampli"]:
+        r.eps = 0
+    out = simulation.simulate_analog(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], chunk_size=100)
+
+    assert np.array_equal(out["time"], tg.t_real)
+    for k in ("L_def", "V_mesure", "V_gain"):
+        assert np.allclose(out[k], expected[k], rtol=1e-9, atol=1e-15)
+
+
+@pytest.mark.unit_test
+def test_simulate_analog_noise():
+    tg = instruments.TimeGenerator(6, 500, 10)
+    expected = run_loop(tg, build_chain(tg, quality="normal"))
+
+    tg = instruments.TimeGenerator(6, 500, 10)
+    c = build_chain(tg, quality="normal")
+    out = simulation.simulate_analog(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"])
+
+    residual = out["V_gain"] - np.array(expected["V_gain"])
+    assert abs(residual.mean()) < 3 * residual.std()
+    assert np.isclose(out["V_gain"].std(), np.std(expected["V_gain"]), rtol=0.2)
+
+
+@pytest.mark.unit_test
+def test_seeded_runs_are_reproducible():
+    runs = []
+    for _ in range(2):
+        tg = instruments.TimeGenerator(3, 500, 10)
+        c = build_chain(tg, quality="normal", seed=1234)
+        tg.compile()
+        runs.append(run_loop(tg, c))
+    assert runs[0]["V_gain"] == runs[1]["V_gain"]
+
+    tg = instruments.TimeGenerator(3, 500, 10)
+    c = build_chain(tg, quality="normal", seed=1234)
+    out = simulation.simulate_analog(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], chunk_size=64)
+    assert np.allclose(out["V_gain"], runs[0]["V_gain"], rtol=1e-9, atol=1e-15)
+
+
+def add_digital_stage(c, multiple=10):
+    env = c["env"]
+    h = instruments.Horloge(env, 10, 1000)
+    c["EB"] = instruments.EchantillonneurBloqueur(h, multiple)
+    c["can"] = instruments.CanCompare(h, 8, 5)
+    c["cpu"] = instruments.Cpu(env, h)
+    return c
+
+
+def no_noise(c):
+    for r in (c["wheastone"].R1, c["wheastone"].R2, c["wheastone"].R3, c["wheastone"].R4) + c["ampli"]:
+        r.eps = 0
+    c["gen"].noise = 0
+    c["gen_ao"].noise = 0
+    return c
+
+
+@pytest.mark.unit_test
+def test_run_ensemble_matches_loop():
+    tg = instruments.TimeGenerator(10, 1000, 10)
+    c = no_noise(add_digital_stage(build_chain(tg)))
+    errors = []
+    for tt in tg:
+        V_mesure = c["wheastone"](c["gen"]())
+        V_gain = montages.montage_ampli_op(c["gen_ao"](), V_mesure, *[r() for r in c["ampli"]])
+        c["can"](c["EB"](V_gain))
+        altitude = c["cpu"](c["can"].out)
+        if tt >= 2000:
+            errors.append(altitude - c["cpu"].altitude_from(c["env"].P))
+
+    tg = instruments.TimeGenerator(10, 1000, 10)
+    c = no_noise(add_digital_stage(build_chain(tg)))
+    stats = simulation.run_ensemble(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], c["EB"], c["can"], c["cpu"],
+                                    3, chunk_size=128, warmup_s=2)
+    assert np.array_equal(stats["count"], [len(errors)]*3)
+    assert np.allclose(stats["mean_error"], np.mean(errors), rtol=1e-9)
+    assert np.allclose(stats["max_abs_error"], np.max(np.abs(errors)), rtol=1e-9)
+    assert np.allclose(stats["std_error"], np.std(errors), rtol=1e-6)
+    assert c["can"].qs == 0 and c["EB"].count == 0
+
+
+@pytest.mark.unit_test
+def test_run_ensemble_variations():
+    tg = instruments.TimeGenerator(10, 1000, 10)
+    c = add_digital_stage(build_chain(tg))
+    R1 = np.array([10e3, 10.5e3, 9.5e3, 10e3])
+    stats = simulation.run_ensemble(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], c["EB"], c["can"], c["cpu"],
+                                    4, variations={"R1.R": R1, "membrane.L": [2.8e-3, 2.8e-3, 2.8e-3, 3e-3]}, seed=3)
+    assert stats["mean_error"].shape == (4,)
+    assert np.all(stats["count"] > 0)
+    assert len(set(np.round(stats["mean_error"], 3))) == 4
+    assert c["wheastone"].R1.R == 10e3 and c["wheastone"].R3.L == 2.8e-3
+
+    again = simulation.run_ensemble(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], c["EB"], c["can"], c["cpu"],
+                                    4, variations={"R1.R": R1, "membrane.L": [2.8e-3, 2.8e-3, 2.8e-3, 3e-3]}, seed=3)
+    assert np.array_equal(again["mean_error"], stats["mean_error"])
+
+
+@pytest.mark.unit_test
+def test_run_ensemble_membrane_length():
+    # a unit with its own membrane length starts from this length, as a chain built with it
+    tg = instruments.TimeGenerator(10, 1000, 10)
+    c = no_noise(add_digital_stage(build_chain(tg)))
+    c["membrane"].alpha = 0.999  # slow membrane : its initial state matters for the whole run
+    stats = simulation.run_ensemble(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], c["EB"], c["can"], c["cpu"],
+                                    2, variations={"membrane.L": [2.8e-3, 3e-3]}, warmup_s=0)
+
+    tg = instruments.TimeGenerator(10, 1000, 10)
+    c = no_noise(add_digital_stage(build_chain(tg)))
+    c["membrane"].alpha = 0.999
+    c["membrane"].L = c["membrane"]._L_def = c["membrane"]._target_L_def = 3e-3
+    c["wheastone"].R3.L = c["wheastone"].R4.L = 3e-3
+    expected = simulation.run_ensemble(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], c["EB"], c["can"], c["cpu"],
+                                       1, warmup_s=0)
+    for k in ("mean_error", "std_error", "max_abs_error"):
+        assert stats[k][1] == pytest.approx(expected[k][0], rel=1e-9)
+
+
+@pytest.mark.unit_test
+def test_calibrate_cpu():
+    tg = instruments.TimeGenerator(3*60-1, 3000, 10)
+    c = no_noise(add_digital_stage(build_chain(tg)))
+    c["TE"].P, c["TE"].T = simulation.sweep_profiles(tg, np.linspace(2.6e4, 0.95e5, 20), [15, 25, 35])
+    assert c["TE"].P.size == tg.size_exp and c["TE"].T[20] == 25
+
+    result = simulation.calibrate_cpu(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], c["EB"], c["can"], c["cpu"], degree=5)
+    assert result["value_can"].size == 60
+    assert result["rms_residual"] < 150
+    assert np.array_equal(c["cpu"].coefficient_correction, result["coefficients"])
+    pression, _ = c["cpu"].convert(result["value_can"])
+    assert np.allclose(pression - result["P"], result["residual"])
+    assert c["can"].qs == 0 and c["EB"].count == 0
+
+    result = simulation.calibrate_cpu(tg, c["TE"], c["wheastone"], c["gen"], c["ampli"], c["gen_ao"], c["EB"], c["can"], c["cpu"],
+                                      degree=5, temperature_degree=1, install=False)
+    assert result["coefficients"].shape == (6, 2)
+    assert np.array_equal(c["cpu"].coefficient_correction.shape, (6,))
+    c["cpu"].calibrate(result["coefficients"])
+    pression, _ = c["cpu"].convert(result["value_can"], result["T"])
+    assert np.allclose(pression - result["P"], result["residual"])
+    c["env"].T = 25
+    assert np.isclose(c["cpu"].calibration(result["value_can"][0]), c["cpu"].convert([result["value_can"][0]], 25)[0][0])
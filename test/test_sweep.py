@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from sensorsim import instruments
+from sensorsim.sweep import grid_point, sweep
+
+
+def deflection(P, e, L):
+    tg = instruments.TimeGenerator(1)
+    env = instruments.Environment(tg, P=P)
+    membrane = instruments.Membrane(env, EIgz=1, diameter=L, P_calib=1.1e5, e=e)
+    return {"strain": (membrane.compute_target_def_x()-L)/L, "L_def": membrane.compute_target_def_x()}
+
+
+@pytest.mark.unit_test
+def test_sweep():
+    grid = {"P": [.2e5, 1.1e5], "e": [1e-4, 1e-5], "L": 2e-4*np.arange(1, 26)}
+    table = sweep(deflection, grid, ["strain"], max_workers=2, batch_size=7)
+    assert len(table) == 100
+    assert list(table.columns) == ["P", "e", "L", "strain"]
+
+    row = table.iloc[37]
+    assert grid_point(grid, 37) == {"P": row["P"], "e": row["e"], "L": row["L"]}
+    assert row["strain"] == deflection(row["P"], row["e"], row["L"])["strain"]
+    # no pressure difference : thermal elongation only
+    assert np.allclose(table["strain"][table["P"] == 1.1e5], 0.409e-6 + 0.686e-9*20)
+
+    local = sweep(deflection, grid, ["strain", "L_def"], max_workers=1)
+    assert np.array_equal(local["strain"], table["strain"])
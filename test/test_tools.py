@@ -0,0 +1,89 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from sensorsim import tools
+
+
+@pytest.mark.unit_test
+def test_lag_filter():
+    x = np.linspace(0, 1, 500)
+    expected = []
+    y = 2.
+    for v in x:
+        y = 0.4*y + 0.6*v
+        expected.append(y)
+    assert np.allclose(tools.lag_filter(x, 0.4, 2.), expected, rtol=1e-12)
+
+
+@pytest.mark.unit_test
+def test_decimate_minmax():
+    t = np.arange(100_000)
+    y = np.sin(t/5000) + 0.01*np.random.default_rng(0).standard_normal(t.size)
+    y[500:700] = np.nan
+    td, yd = tools.decimate_minmax(t, y, 1000)
+    assert td.size <= 1002 and np.all(np.diff(td) > 0)
+    assert np.nanmax(yd) == np.nanmax(y) and np.nanmin(yd) == np.nanmin(y)
+    assert td[0] == 0 and td[-1] == t[-1]
+    assert tools.decimate_minmax(t[:10], y[:10], 1000)[1].size == 10
+
+
+@pytest.mark.unit_test
+def test_decimate_steps():
+    t = np.arange(100_000)
+    y = (t // 7000) % 3
+    td, yd = tools.decimate_steps(t, y, 1000)
+    assert td.size == 16
+    # same step graph : hold the kept values on the whole time base
+    held = yd[np.searchsorted(td, t, side="right") - 1]
+    assert np.array_equal(held, y)
+
+    clock = t % 2
+    assert tools.decimate_steps(t, clock, 1000)[0].size <= 1002
+
+
+@pytest.mark.unit_test
+def test_decimate_memmap(tmp_path):
+    n = 2_000_000
+    y = np.sin(np.arange(n)/10_000) + (np.arange(n) % 7 == 0)
+    y[1000:3000] = np.nan
+    y.tofile(tmp_path / "y.bin")
+    t = np.arange(n, dtype=float)
+    t.tofile(tmp_path / "t.bin")
+    expected = {"minmax": tools.decimate_minmax(t, y, 999), "steps": tools.decimate_steps(t, y, 999)}
+    t = np.memmap(tmp_path / "t.bin", dtype=float, mode="r", shape=(n,))
+    y = np.memmap(tmp_path / "y.bin", dtype=float, mode="r", shape=(n,))
+    tracemalloc.start()
+    try:
+        result = {"minmax": tools.decimate_minmax(t, y, 999), "steps": tools.decimate_steps(t, y, 999)}
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # the column (16 MB) is read by chunks, never copied as a whole
+    assert peak < y.nbytes / 8
+    for k in expected:
+        assert np.array_equal(result[k][0], expected[k][0])
+        assert np.array_equal(result[k][1], expected[k][1], equal_nan=True)
+
+
+@pytest.mark.unit_test
+def test_lttb():
+    t = np.arange(50_000)
+    y = np.where(t == 31_234, 10., np.sin(t/3000))
+    td, yd = tools.lttb(t, y, 500)
+    assert td.size == 500 and np.all(np.diff(td) > 0)
+    assert 31_234 in td
+    assert tools.decimate(t, y, 500, "lttb")[0].size == 500
+    with pytest.raises(ValueError):
+        tools.decimate(t, y, 500, "mean")
+
+
+@pytest.mark.unit_test
+def test_make_calibration_plot():
+    x = np.linspace(2e4, 1e5, 20_000)
+    fig = tools.make_calibration_plot(x, x + 1, x, tools.compute_error(x + 1, x))
+    assert [trace.type for trace in fig.data] == ["scattergl"]*3
+    assert fig.data[2].yaxis == "y2"
+    fig = tools.make_calibration_plot(x[:10], x[:10], x[:10], [0]*10)
+    assert fig.data[0].type == "scatter"